@@ -1,6 +1,5 @@
 import pyodbc, os, sys, re, unicodedata
 import pandas as pd
-from tkinter import Tk, filedialog, simpledialog
 from rapidfuzz import fuzz
 from functools import lru_cache
 import numpy as np
@@ -299,15 +298,21 @@ def get_primary_keys(conn):
 
 def build_schema_dict(rows, pk_dict, fk_list):
     """rows: [(Table,Col,Type)], pk_dict: {tbl:[col]}, fk_list: list[dict]"""
-    from collections import defaultdict
-    schema = defaultdict(lambda: {'cols': [], 'pk': [], 'fks': []})
+    schema = {}
+
+    def entry(t):
+        e = schema.get(t)
+        if e is None:
+            e = schema[t] = {'cols': [], 'pk': [], 'fks': []}
+        return e
+
     for t, c, d in rows:
-        schema[t]['cols'].append((c, d))
+        entry(t)['cols'].append((c, d))
     for t, pkcols in pk_dict.items():
-        schema[t]['pk'] = pkcols
+        entry(t)['pk'] = pkcols
     for fk in fk_list:
-        schema[fk['parent_tbl']]['fks'].append(fk)
-    return dict(schema)
+        entry(fk['parent_tbl'])['fks'].append(fk)
+    return schema
 
 def load_abbr_syn_dict(grading_conn_str):
     global ABBR, SYN
@@ -947,6 +952,7 @@ def phase2_one(ans_tbl, stu_tbl, ans_schema, stu_schema):
     return rows
 def main():
     import traceback
+    from tkinter import Tk, filedialog, simpledialog
     debug_log = open("debug_fuzzy_matching.txt", "w", encoding="utf-8")
     sys.stdout = debug_log
     try:
@@ -1,6 +1,5 @@
 import pyodbc, os, sys, re, unicodedata
 import pandas as pd
-from tkinter import Tk, filedialog, simpledialog
 from rapidfuzz import fuzz
 from functools import lru_cache
 
@@ -302,6 +301,7 @@ def insert_temp_matching(grading_conn_str, stats):
         )
 
 def main():
+    from tkinter import Tk, filedialog, simpledialog
     debug_log = open("debug_fuzzy_matching.txt", "w", encoding="utf-8")
     sys.stdout = debug_log
     try:
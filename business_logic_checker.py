@@ -20,17 +20,32 @@ Expected row count increases:
 import os
 import sys
 import csv
+import json
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-# Add the v1 package to path
-sys.path.insert(0, str(Path(__file__).parent / "v1"))
+# v1 modules are imported on first use (see _lazy_import) so that startup
+# and the GUI prompts do not pay for pyodbc/config loading up front.
+connection = None
+restore = None
+GradingConfig = None
+logger = None
 
-from v1.schema_grader.db import connection, restore
-from v1.schema_grader.config import GradingConfig
-from v1.schema_grader.utils.log import get_logger
-
-logger = get_logger(__name__)
+def _lazy_import():
+    """Import the v1 grading modules the first time they are needed."""
+    global connection, restore, GradingConfig, logger
+    if connection is not None:
+        return
+    
+    from v1.schema_grader.db import connection as _connection, restore as _restore
+    from v1.schema_grader.config import GradingConfig as _GradingConfig
+    from v1.schema_grader.utils.log import get_logger
+    
+    connection = _connection
+    restore = _restore
+    GradingConfig = _GradingConfig
+    logger = get_logger(__name__)
 
 # Expected business logic changes
 EXPECTED_CHANGES = {
@@ -41,10 +56,16 @@ EXPECTED_CHANGES = {
     'ChiTietMuaHang': 1   # +1 Purchase detail
 }
 
+def _get_conn(server: str, user: str, password: str, database: str, **kw):
+    """Open a connection via connection.open_conn (which already sets NOCOUNT ON)."""
+    _lazy_import()
+    return connection.open_conn(server, user, password, database, **kw)
+
 def get_table_row_count(server: str, user: str, password: str, database: str, table: str) -> int:
     """Get row count for a specific table."""
+    _lazy_import()
     try:
-        with connection.open_conn(server, user, password, database) as conn:
+        with _get_conn(server, user, password, database) as conn:
             cursor = conn.cursor()
             cursor.execute(f"SELECT COUNT(*) FROM [{table}]")
             return cursor.fetchone()[0]
@@ -98,12 +119,73 @@ def check_business_logic_implementation(server: str, user: str, password: str,
     
     return result
 
-def analyze_student_business_logic(config: GradingConfig, bak_file: str) -> Dict:
-    """Analyze business logic implementation for one student."""
+@lru_cache(maxsize=None)
+def _answer_db_version(server: str, user: str, password: str) -> Optional[str]:
+    """create_date of the answer database, which changes whenever it is restored."""
+    try:
+        with _get_conn(server, user, password, "master") as conn:
+            created = conn.cursor().execute(
+                "SELECT create_date FROM sys.databases WHERE name = '00000001'").fetchval()
+    except Exception as e:
+        logger.warning(f"Could not read answer database version: {e}")
+        return None
+    return None if created is None else created.isoformat()
+
+def _bak_cache_key(config: 'GradingConfig', bak_file: str) -> List:
+    """Key identifying one analysis: .bak version (size + mtime), answer DB and expected deltas."""
+    return [os.path.getsize(bak_file), os.path.getmtime(bak_file),
+            _answer_db_version(config.server, config.user, config.password),
+            sorted([table, delta] for table, delta in EXPECTED_CHANGES.items())]
+
+def _result_cache_path(config: 'GradingConfig', student_id: str) -> Path:
+    """Location of the cached analysis result for a student."""
+    return Path(config.output_folder) / 'cache' / f'{student_id}.json'
+
+def _load_cached_result(cache_path: Path, key: List) -> Optional[Dict]:
+    """Return the cached result if it was computed from the same .bak file."""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if key[2] is None or cached.get('key') != key:
+        return None
+    return cached.get('result')
+
+def _save_cached_result(cache_path: Path, key: List, result: Dict):
+    """Persist a successful analysis result next to the report.
+    
+    Results with a table that could not be read are not cached, so a
+    transient DB error is retried on the next run.
+    """
+    if key[2] is None or any('error' in t for t in result.get('tables_checked', {}).values()):
+        return
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'result': result}, f, ensure_ascii=False)
+    except OSError as e:
+        logger.warning(f"Could not write result cache {cache_path}: {e}")
+
+def analyze_student_business_logic(config: 'GradingConfig', bak_file: str) -> Dict:
+    """Analyze business logic implementation for one student.
+    
+    Results are cached per student under <output_folder>/cache and reused
+    while the .bak file, the answer database and EXPECTED_CHANGES are unchanged,
+    skipping the restore/query/drop cycle.
+    """
+    _lazy_import()
     
     student_id = Path(bak_file).stem
     student_db = f"student_{student_id}"
     
+    cache_key = _bak_cache_key(config, bak_file)
+    cache_path = _result_cache_path(config, student_id)
+    cached = _load_cached_result(cache_path, cache_key)
+    if cached is not None:
+        logger.info(f"Using cached result for {student_id}")
+        return cached
+    
     result = {
         'MSSV': student_id,
         'success': False,
@@ -133,10 +215,11 @@ def analyze_student_business_logic(config: GradingConfig, bak_file: str) -> Dict
         
         result.update(business_check)
         result['success'] = True
+        _save_cached_result(cache_path, cache_key, result)
         
         # Clean up - drop student database
         try:
-            with connection.open_conn(config.server, config.user, config.password, "master") as conn:
+            with _get_conn(config.server, config.user, config.password, "master") as conn:
                 cursor = conn.cursor()
                 cursor.execute(f"ALTER DATABASE [{student_db}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE")
                 cursor.execute(f"DROP DATABASE [{student_db}]")
@@ -150,96 +233,132 @@ def analyze_student_business_logic(config: GradingConfig, bak_file: str) -> Dict
         
     return result
 
-def generate_business_logic_report(results: List[Dict], output_file: str):
-    """Generate CSV report for business logic analysis."""
-    
-    # Prepare CSV data
-    csv_data = []
+REPORT_FIELDS = [
+    'MSSV', 'Tên bảng', 'Số dòng đáp án', 'Số dòng sinh viên',
+    'Tăng mong đợi', 'Tăng thực tế', 'Số dòng khớp',
+    'Đã nhập đúng nghiệp vụ', 'Điểm', 'Ghi chú'
+]
+
+def _report_rows(result: Dict):
+    """Yield the CSV rows describing one student result."""
+    student_id = result['MSSV']
+    
+    if not result['success']:
+        # Error case
+        yield {
+            'MSSV': student_id,
+            'Tên bảng': 'ERROR',
+            'Số dòng đáp án': 0,
+            'Số dòng sinh viên': 0,
+            'Tăng mong đợi': 0,
+            'Tăng thực tế': 0,
+            'Số dòng khớp': 0,
+            'Đã nhập đúng nghiệp vụ': 0,
+            'Điểm': f"0/{len(EXPECTED_CHANGES)}",
+            'Ghi chú': result.get('error', 'Unknown error')
+        }
+        return
+    
+    # Success case - add row for each table
+    all_correct = result.get('all_correct', False)
+    score = result.get('total_score', 0)
+    max_score = result.get('max_score', len(EXPECTED_CHANGES))
+    
+    for table, table_data in result['tables_checked'].items():
+        yield {
+            'MSSV': student_id,
+            'Tên bảng': table,
+            'Số dòng đáp án': table_data['answer_count'],
+            'Số dòng sinh viên': table_data['student_count'],
+            'Tăng mong đợi': table_data['expected_increase'],
+            'Tăng thực tế': table_data['actual_increase'],
+            'Số dòng khớp': 1 if table_data['correct'] else 0,
+            'Đã nhập đúng nghiệp vụ': 1 if all_correct else 0,
+            'Điểm': f"{score}/{max_score}",
+            'Ghi chú': 'OK' if table_data['correct'] else f"Tăng {table_data['actual_increase']} thay vì {table_data['expected_increase']}"
+        }
+
+def open_report(output_file: str) -> Dict:
+    """Open the CSV report for streaming and write the header once.
+    
+    Returns a report handle holding the file, the writer and the running
+    statistics needed by print_summary, so results never pile up in memory.
+    """
+    f = open(output_file, 'w', newline='', encoding='utf-8-sig')
+    writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+    writer.writeheader()
+    return {
+        'path': output_file,
+        'file': f,
+        'writer': writer,
+        'stats': {
+            'total_students': 0,
+            'successful_analysis': 0,
+            'perfect_scores': 0,
+            'score_dist': {}
+        }
+    }
+
+def write_result(report: Dict, result: Dict):
+    """Append one student result to the report and update the statistics."""
+    report['writer'].writerows(_report_rows(result))
+    report['file'].flush()
+    
+    stats = report['stats']
+    stats['total_students'] += 1
+    if result.get('all_correct', False):
+        stats['perfect_scores'] += 1
+    if result['success']:
+        stats['successful_analysis'] += 1
+        score = result.get('total_score', 0)
+        max_score = result.get('max_score', len(EXPECTED_CHANGES))
+        score_key = f"{score}/{max_score}"
+        stats['score_dist'][score_key] = stats['score_dist'].get(score_key, 0) + 1
+
+def close_report(report: Dict):
+    """Close the CSV report and print the summary statistics."""
+    report['file'].close()
     
-    for result in results:
-        student_id = result['MSSV']
-        
-        if not result['success']:
-            # Error case
-            csv_data.append({
-                'MSSV': student_id,
-                'Tên bảng': 'ERROR',
-                'Số dòng đáp án': 0,
-                'Số dòng sinh viên': 0,
-                'Tăng mong đợi': 0,
-                'Tăng thực tế': 0,
-                'Số dòng khớp': 0,
-                'Đã nhập đúng nghiệp vụ': 0,
-                'Điểm': f"0/{len(EXPECTED_CHANGES)}",
-                'Ghi chú': result.get('error', 'Unknown error')
-            })
-        else:
-            # Success case - add row for each table
-            all_correct = result.get('all_correct', False)
-            score = result.get('total_score', 0)
-            max_score = result.get('max_score', len(EXPECTED_CHANGES))
-            
-            for table, table_data in result['tables_checked'].items():
-                csv_data.append({
-                    'MSSV': student_id,
-                    'Tên bảng': table,
-                    'Số dòng đáp án': table_data['answer_count'],
-                    'Số dòng sinh viên': table_data['student_count'],
-                    'Tăng mong đợi': table_data['expected_increase'],
-                    'Tăng thực tế': table_data['actual_increase'],
-                    'Số dòng khớp': 1 if table_data['correct'] else 0,
-                    'Đã nhập đúng nghiệp vụ': 1 if all_correct else 0,
-                    'Điểm': f"{score}/{max_score}",
-                    'Ghi chú': 'OK' if table_data['correct'] else f"Tăng {table_data['actual_increase']} thay vì {table_data['expected_increase']}"
-                })
-    
-    # Write CSV
-    with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
-        if csv_data:
-            writer = csv.DictWriter(f, fieldnames=csv_data[0].keys())
-            writer.writeheader()
-            writer.writerows(csv_data)
-    
-    print(f"📊 Báo cáo đã được lưu: {output_file}")
+    print(f"📊 Báo cáo đã được lưu: {report['path']}")
     
     # Print summary
-    print_summary(results)
+    print_summary(report['stats'])
 
-def print_summary(results: List[Dict]):
-    """Print summary statistics."""
-    
-    print("\n" + "="*80)
-    print("TỔNG KẾT KIỂM TRA NGHIỆP VỤ")
-    print("="*80)
-    
-    total_students = len(results)
-    successful_analysis = len([r for r in results if r['success']])
-    perfect_scores = len([r for r in results if r.get('all_correct', False)])
-    
-    print(f"📋 Tổng số sinh viên: {total_students}")
-    print(f"✅ Phân tích thành công: {successful_analysis}")
-    print(f"🎯 Làm đúng hoàn toàn: {perfect_scores}")
-    print(f"📈 Tỷ lệ thành công: {perfect_scores/total_students*100:.1f}%")
-    
-    print(f"\n📝 Nghiệp vụ cần kiểm tra:")
-    for table, expected in EXPECTED_CHANGES.items():
-        print(f"   {table}: +{expected} dòng")
+def print_summary(stats: Dict):
+    """Print summary statistics.
+    
+    The whole block is assembled first and written to stdout in one call
+    rather than one print() per line.
+    """
+    total_students = stats['total_students']
+    successful_analysis = stats['successful_analysis']
+    perfect_scores = stats['perfect_scores']
+    # No student may have been written yet (Ctrl+C or an early error in main)
+    success_rate = (perfect_scores / total_students * 100) if total_students else 0.0
+    
+    lines = [
+        "",
+        "="*80,
+        "TỔNG KẾT KIỂM TRA NGHIỆP VỤ",
+        "="*80,
+        f"📋 Tổng số sinh viên: {total_students}",
+        f"✅ Phân tích thành công: {successful_analysis}",
+        f"🎯 Làm đúng hoàn toàn: {perfect_scores}",
+        f"📈 Tỷ lệ thành công: {success_rate:.1f}%",
+        "",
+        "📝 Nghiệp vụ cần kiểm tra:",
+    ]
+    lines.extend(f"   {table}: +{expected} dòng" for table, expected in EXPECTED_CHANGES.items())
     
     # Score distribution
-    score_dist = {}
-    for result in results:
-        if result['success']:
-            score = result.get('total_score', 0)
-            max_score = result.get('max_score', len(EXPECTED_CHANGES))
-            score_key = f"{score}/{max_score}"
-            score_dist[score_key] = score_dist.get(score_key, 0) + 1
-    
+    score_dist = stats['score_dist']
     if score_dist:
-        print(f"\n📊 Phân bố điểm:")
-        for score, count in sorted(score_dist.items()):
-            print(f"   {score}: {count} sinh viên")
+        lines.append("")
+        lines.append("📊 Phân bố điểm:")
+        lines.extend(f"   {score}: {count} sinh viên" for score, count in sorted(score_dist.items()))
     
-    print("="*80)
+    lines.append("="*80)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 def main():
     """Main function."""
@@ -282,6 +401,7 @@ def main():
     root.destroy()
     
     # Setup
+    _lazy_import()
     config = GradingConfig(
         server=server,
         user=user,
@@ -304,26 +424,27 @@ def main():
     
     print(f"🔍 Tìm thấy {len(bak_files)} file .bak để kiểm tra...")
     
-    # Analyze each student
-    results = []
-    for i, bak_file in enumerate(sorted(bak_files), 1):
-        student_name = Path(bak_file).stem
-        print(f"[{i}/{len(bak_files)}] 🔄 Kiểm tra {student_name}...")
+    # Analyze each student, streaming every result straight into the report
+    output_file = os.path.join(config.output_folder, "business_logic_check.csv")
+    report = open_report(output_file)
+    try:
+        for i, bak_file in enumerate(sorted(bak_files), 1):
+            student_name = Path(bak_file).stem
+            print(f"[{i}/{len(bak_files)}] 🔄 Kiểm tra {student_name}...")
         
-        result = analyze_student_business_logic(config, bak_file)
-        results.append(result)
+            result = analyze_student_business_logic(config, bak_file)
+            write_result(report, result)
         
-        # Show quick result
-        if result['success']:
-            score = result.get('total_score', 0)
-            max_score = result.get('max_score', len(EXPECTED_CHANGES))
-            print(f"   ✅ Hoàn thành: {score}/{max_score} điểm")
-        else:
-            print(f"   ❌ Lỗi: {result.get('error', 'Unknown')}")
-    
-    # Generate report
-    output_file = os.path.join(config.output_folder, "business_logic_check.csv")
-    generate_business_logic_report(results, output_file)
+            # Show quick result
+            if result['success']:
+                score = result.get('total_score', 0)
+                max_score = result.get('max_score', len(EXPECTED_CHANGES))
+                print(f"   ✅ Hoàn thành: {score}/{max_score} điểm")
+            else:
+                print(f"   ❌ Lỗi: {result.get('error', 'Unknown')}")
+    finally:
+        # Finish report (also on error/Ctrl+C so the CSV is closed and the partial summary shown)
+        close_report(report)
     
     print(f"\n🎉 Hoàn thành! Kết quả: {output_file}")
 
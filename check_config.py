@@ -41,7 +41,9 @@ def check_configuration():
     
     # Test if system works
     try:
-        sys.path.insert(0, str(Path(__file__).parent))
+        root_dir = str(Path(__file__).parent)
+        if root_dir not in sys.path:
+            sys.path.insert(0, root_dir)
         from v1.schema_grader.embedding.gemini import _API_AVAILABLE
         
         if _API_AVAILABLE:
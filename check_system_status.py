@@ -5,7 +5,8 @@ Quick system status check for the grading system.
 
 import os
 import sys
-sys.path.append('v1')
+if 'v1' not in sys.path:
+    sys.path.append('v1')
 
 from v1.schema_grader.utils.constants import API_KEY
 from v1.schema_grader.embedding.gemini import _initialize_gemini, is_api_available
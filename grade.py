@@ -11,7 +11,9 @@ import sys
 from pathlib import Path
 
 # Add the new package to path
-sys.path.insert(0, str(Path(__file__).parent / "v1"))
+_V1_DIR = str(Path(__file__).parent / "v1")
+if _V1_DIR not in sys.path:
+    sys.path.insert(0, _V1_DIR)
 
 # Import new system
 from v1.schema_grader import SchemaGrader
@@ -63,11 +65,9 @@ def main():
     # Load answer schema
     print("📊 Loading answer schema...")
     try:
-        with connection.open_conn(config.server, config.user, config.password, "00000001") as conn:
-            ans_struct = schema_reader.get_table_structures(conn)
+        with connection.scoped_conn(config.server, config.user, config.password, "00000001") as conn:
+            ans_struct, ans_pk, ans_fk = schema_reader.get_all_metadata(conn)
             ans_struct = clean_rows(ans_struct)
-            ans_pk = schema_reader.get_primary_keys(conn)
-            ans_fk = schema_reader.get_foreign_keys_full(conn)
             
         answer_schema = build_schema_dict(ans_struct, ans_pk, ans_fk)
         print(f"✅ Loaded {len(answer_schema)} tables from answer schema")
@@ -102,10 +102,11 @@ def main():
         
         # List individual results
         print("\n📝 Individual Results:")
-        for result in results:
-            db_name = result.get('db_name', 'Unknown')
-            score = result.get('schema_score', 'N/A')
-            print(f"  • {db_name}: {score}")
+        # One write for the whole listing instead of a print per result
+        print("\n".join(
+            f"  • {result.get('db_name', 'Unknown')}: {result.get('schema_score', 'N/A')}"
+            for result in results
+        ))
             
     else:
         print("❌ No databases were successfully graded")
@@ -2,24 +2,49 @@
 Database schema building utilities for grading system.
 """
 
-from collections import defaultdict
+import logging
+from collections import OrderedDict
 from typing import Dict, List, Any, Tuple
 from ..utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# (new key, legacy key, default) for foreign key dicts
+_FK_KEY_MAP = (
+    ('name', 'name', ''),
+    ('parent_table', 'parent_tbl', ''),
+    ('parent_columns', 'parent_cols', []),
+    ('referenced_table', 'ref_tbl', ''),
+    ('referenced_columns', 'ref_cols', []),
+)
+
+
+def _normalize_fk(fk: Dict) -> Dict:
+    """Convert a foreign key dict (new or legacy keys) to the new format."""
+    return {new: fk[new] if new in fk else fk.get(old, default)
+            for new, old, default in _FK_KEY_MAP}
+
+
+def _new_entry() -> Dict[str, Any]:
+    """Create an empty schema entry for one table."""
+    return {
+        'original_name': '', 
+        'columns': [], 
+        'column_names': [], 
+        'column_types': [], 
+        'primary_keys': [], 
+        'foreign_keys': []
+    }
+
 
 class SchemaBuilder:
     """Builder class for constructing schema dictionaries from database metadata."""
     
     def __init__(self):
         """Initialize schema builder."""
-        self.schema = defaultdict(lambda: {
-            'original_name': '', 
-            'columns': [], 
-            'primary_keys': [], 
-            'foreign_keys': []
-        })
+        self.schema: Dict[str, Dict] = {}
+        self._orig_index: Dict[str, str] = {}
+        self._orig_ci_index: Dict[str, str] = {}
     
     def build_schema_dict(self, table_data_list: List[Dict], 
                          pk_dict: Dict[str, List[str]], 
@@ -31,11 +56,17 @@ class SchemaBuilder:
                            each {'original_name': str, 'cleaned_name': str, 'column_name': str, 'data_type': str}
             pk_dict: Dict {original_table_name: [primary_key_columns]}
             fk_list: List of foreign key info, where table names are original
+                     (new or legacy keys; normalized once here)
         
         Returns:
-            dict: Schema with structure {cleaned_table_name: {'original_name': str, 'columns': [], 'primary_keys': [], 'foreign_keys': []}}
+            dict: Schema with structure {cleaned_table_name: {'original_name': str, 'columns': [], 'column_names': [],
+                  'column_types': [], 'primary_keys': [], 'foreign_keys': []}}
         """
-        logger.debug(f"Building schema from {len(table_data_list)} table data items...")
+        logger.debug("Building schema from %d table data items...", len(table_data_list))
+        
+        # Single conversion point for legacy FK keys; everything after this
+        # (including the built schema) uses the new key names only
+        fk_list = [_normalize_fk(fk) for fk in fk_list]
         
         # Track original names for debugging
         original_names_seen = set()
@@ -47,22 +78,38 @@ class SchemaBuilder:
             
             original_names_seen.add(original_t)
             
+            entry = self.schema.get(cleaned_t)
+            if entry is None:
+                entry = self.schema[cleaned_t] = _new_entry()
+            
             # Store original name (first one encountered for a cleaned name)
-            if not self.schema[cleaned_t]['original_name']:
-                self.schema[cleaned_t]['original_name'] = original_t
-            elif self.schema[cleaned_t]['original_name'] != original_t:
+            if not entry['original_name']:
+                entry['original_name'] = original_t
+            elif entry['original_name'] != original_t:
                 # Handle case where multiple original names map to same cleaned name
                 logger.warning(
                     f"Cleaned name '{cleaned_t}' maps to multiple original names: "
-                    f"'{self.schema[cleaned_t]['original_name']}' and '{original_t}'. "
+                    f"'{entry['original_name']}' and '{original_t}'. "
                     f"Using the first one."
                 )
 
-            self.schema[cleaned_t]['columns'].append((item['column_name'], item['data_type']))
+            entry['columns'].append((item['column_name'], item['data_type']))
+            # Parallel arrays (names/types) so matchers don't unpack tuples
+            entry['column_names'].append(item['column_name'])
+            entry['column_types'].append(item['data_type'])
 
-        logger.debug(f"Original table names seen in data: {sorted(original_names_seen)}")
-        logger.debug(f"PK dict keys: {sorted(pk_dict.keys())}")
-        logger.debug(f"FK parent tables: {sorted(set(fk.get('parent_table', fk.get('parent_tbl', '')) for fk in fk_list))}")
+        # Reverse index original_name -> cleaned_name (first cleaned name wins,
+        # same as the old linear scan over self.schema)
+        self._orig_index = {}
+        self._orig_ci_index = {}
+        for cleaned_name, data in self.schema.items():
+            self._orig_index.setdefault(data['original_name'], cleaned_name)
+            self._orig_ci_index.setdefault(data['original_name'].strip().upper(), cleaned_name)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Original table names seen in data: %s", sorted(original_names_seen))
+            logger.debug("PK dict keys: %s", sorted(pk_dict.keys()))
+            logger.debug("FK parent tables: %s", sorted(set(fk['parent_table'] for fk in fk_list)))
         
         # Add primary keys
         self._add_primary_keys(pk_dict)
@@ -81,17 +128,9 @@ class SchemaBuilder:
         Returns:
             str: Cleaned table name, or None if not found
         """
-        # Try exact match first
-        for cleaned_name, data in self.schema.items():
-            if data['original_name'] == original_name:
-                return cleaned_name
-        
-        # Try case-insensitive and whitespace-normalized match
-        for cleaned_name, data in self.schema.items():
-            if data['original_name'].strip().upper() == original_name.strip().upper():
-                return cleaned_name
-        
-        return None
+        # Try exact match first, then case-insensitive and whitespace-normalized match
+        return (self._orig_index.get(original_name)
+                or self._orig_ci_index.get(original_name.strip().upper()))
     
     def _add_primary_keys(self, pk_dict: Dict[str, List[str]]):
         """Add primary key information to schema.
@@ -111,24 +150,16 @@ class SchemaBuilder:
         """Add foreign key information to schema.
         
         Args:
-            fk_list: List of foreign key information dictionaries
+            fk_list: List of foreign key information dictionaries (new key names)
         """
         for fk in fk_list:
-            # Handle both new and legacy column naming
-            original_parent_tbl = fk.get('parent_table', fk.get('parent_tbl', ''))
+            assert 'parent_table' in fk, "FK dicts must be normalized with _normalize_fk first"
+            original_parent_tbl = fk['parent_table']
             
             found_cleaned_parent_name = self._find_cleaned_name_for_original(original_parent_tbl)
             
             if found_cleaned_parent_name:
-                # Normalize FK info to new format
-                normalized_fk = {
-                    'name': fk.get('name', ''),
-                    'parent_table': fk.get('parent_table', fk.get('parent_tbl', '')),
-                    'parent_columns': fk.get('parent_columns', fk.get('parent_cols', [])),
-                    'referenced_table': fk.get('referenced_table', fk.get('ref_tbl', '')),
-                    'referenced_columns': fk.get('referenced_columns', fk.get('ref_cols', []))
-                }
-                self.schema[found_cleaned_parent_name]['foreign_keys'].append(normalized_fk)
+                self.schema[found_cleaned_parent_name]['foreign_keys'].append(fk)
             else:
                 logger.warning(f"FK parent table '{original_parent_tbl}' not found in schema based on original names.")
 
@@ -150,8 +181,44 @@ def build_schema_dict(table_data_list: List[Dict],
     return builder.build_schema_dict(table_data_list, pk_dict, fk_list)
 
 
+# Derived results per schema: {id(schema): (schema, {name: result})}.
+# Keeping the schema referenced here means its id cannot be reused while cached.
+_ANALYSIS_CACHE_SIZE = 32
+_analysis_cache: "OrderedDict[int, Tuple[Dict, Dict[str, Any]]]" = OrderedDict()
+
+
+def _schema_cache(schema: Dict[str, Dict]) -> Dict[str, Any]:
+    """Return the cache of derived results for a schema (schemas are read-only after build)."""
+    key = id(schema)
+    hit = _analysis_cache.get(key)
+    if hit is not None and hit[0] is schema:
+        _analysis_cache.move_to_end(key)
+        return hit[1]
+    
+    cache = {}
+    _analysis_cache[key] = (schema, cache)
+    if len(_analysis_cache) > _ANALYSIS_CACHE_SIZE:
+        _analysis_cache.popitem(last=False)
+    return cache
+
+
 class SchemaAnalyzer:
-    """Analyzer class for extracting insights from schema dictionaries."""
+    """Analyzer class for extracting insights from schema dictionaries.
+    
+    List results are cached per schema object; call invalidate_cache()
+    after mutating a schema that has already been analyzed.
+    """
+    
+    @staticmethod
+    def invalidate_cache(schema: Dict[str, Dict]) -> None:
+        """Drop cached results for a schema.
+        
+        Args:
+            schema: Schema dictionary
+        """
+        hit = _analysis_cache.get(id(schema))
+        if hit is not None and hit[0] is schema:
+            del _analysis_cache[id(schema)]
     
     @staticmethod
     def get_table_count(schema: Dict[str, Dict]) -> int:
@@ -187,8 +254,11 @@ class SchemaAnalyzer:
         Returns:
             List[str]: Table names with primary keys
         """
-        return [table_name for table_name, table_info in schema.items() 
-                if table_info['primary_keys']]
+        cache = _schema_cache(schema)
+        if 'pk_tables' not in cache:
+            cache['pk_tables'] = [table_name for table_name, table_info in schema.items() 
+                                  if table_info['primary_keys']]
+        return list(cache['pk_tables'])
     
     @staticmethod
     def get_tables_with_foreign_keys(schema: Dict[str, Dict]) -> List[str]:
@@ -200,8 +270,11 @@ class SchemaAnalyzer:
         Returns:
             List[str]: Table names with foreign keys
         """
-        return [table_name for table_name, table_info in schema.items() 
-                if table_info['foreign_keys']]
+        cache = _schema_cache(schema)
+        if 'fk_tables' not in cache:
+            cache['fk_tables'] = [table_name for table_name, table_info in schema.items() 
+                                  if table_info['foreign_keys']]
+        return list(cache['fk_tables'])
     
     @staticmethod
     def get_foreign_key_relationships(schema: Dict[str, Dict]) -> List[Tuple[str, str]]:
@@ -213,10 +286,11 @@ class SchemaAnalyzer:
         Returns:
             List[Tuple[str, str]]: List of (parent_table, referenced_table) pairs
         """
-        relationships = []
-        for table_name, table_info in schema.items():
-            for fk in table_info['foreign_keys']:
-                parent_table = fk.get('parent_table', fk.get('parent_tbl', ''))
-                referenced_table = fk.get('referenced_table', fk.get('ref_tbl', ''))
-                relationships.append((parent_table, referenced_table))
-        return relationships
+        cache = _schema_cache(schema)
+        if 'fk_rels' not in cache:
+            relationships = []
+            for table_name, table_info in schema.items():
+                for fk in table_info['foreign_keys']:
+                    relationships.append((fk['parent_table'], fk['referenced_table']))
+            cache['fk_rels'] = relationships
+        return list(cache['fk_rels'])
@@ -2,13 +2,21 @@
 Database schema reading utilities for grading system.
 """
 
+import logging
 import re
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
 from typing import Dict, List, Tuple, Any
 from ..utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# Numeric prefixes like "08." or "07. " (with optional space after dot)
+_PREFIX_RE = re.compile(r'^\d+\.\s*')
 
+
+@lru_cache(maxsize=1024)
 def clean_table_name(name: str) -> str:
     """Clean table name by removing numeric prefixes and normalizing case.
     
@@ -18,10 +26,8 @@ def clean_table_name(name: str) -> str:
     Returns:
         str: Cleaned table name in uppercase
     """
-    # Remove numeric prefixes like "08." or "07. " (with optional space after dot)
-    cleaned = re.sub(r'^\d+\.\s*', '', name)
-    # Convert to uppercase for consistency
-    return cleaned.upper()
+    # Remove numeric prefixes, then convert to uppercase for consistency
+    return _PREFIX_RE.sub('', name).upper()
 
 
 def get_table_structures(connection) -> List[Dict[str, str]]:
@@ -44,25 +50,32 @@ def get_table_structures(connection) -> List[Dict[str, str]]:
     
     try:
         cursor = connection.cursor()
-        rows = cursor.execute(sql).fetchall()
+        cursor.execute(sql)
         
         table_data = []
-        raw_table_names = set()
+        clean = clean_table_name
         
-        for original_t, c, d in rows:
-            raw_table_names.add(original_t)
-            cleaned_t = clean_table_name(original_t)
-            table_data.append({
-                'original_name': original_t, 
-                'cleaned_name': cleaned_t, 
-                'column_name': c, 
-                'data_type': d
-            })
+        # Stream the result set in batches instead of materializing it with fetchall()
+        while True:
+            batch = cursor.fetchmany(1000)
+            if not batch:
+                break
+            table_data.extend([
+                {
+                    'original_name': original_t, 
+                    'cleaned_name': clean(original_t), 
+                    'column_name': c, 
+                    'data_type': d
+                }
+                for original_t, c, d in batch
+            ])
         
-        logger.debug(f"Raw table names from DB: {sorted(raw_table_names)}")
-        logger.debug(f"Sample cleaning - '08.CT_ChiTien' -> '{clean_table_name('08.CT_ChiTien')}'")
-        logger.debug(f"Sample cleaning - '07.ChiTien' -> '{clean_table_name('07.ChiTien')}'")
-        logger.debug(f"Sample cleaning - '07. CHITIEN' -> '{clean_table_name('07. CHITIEN')}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            raw_table_names = {item['original_name'] for item in table_data}
+            logger.debug(f"Raw table names from DB: {sorted(raw_table_names)}")
+            logger.debug(f"Sample cleaning - '08.CT_ChiTien' -> '{clean_table_name('08.CT_ChiTien')}'")
+            logger.debug(f"Sample cleaning - '07.ChiTien' -> '{clean_table_name('07.ChiTien')}'")
+            logger.debug(f"Sample cleaning - '07. CHITIEN' -> '{clean_table_name('07. CHITIEN')}'")
         
         return table_data
         
@@ -90,9 +103,9 @@ def get_primary_keys(connection) -> Dict[str, List[str]]:
     
     try:
         cursor = connection.cursor()
-        pk = {}
-        for tbl_original_name, col in cursor.execute(sql):
-            pk.setdefault(tbl_original_name, []).append(col)
+        # Rows come ordered by table name, so one dict insertion per table
+        pk = {tbl_original_name: [row[1] for row in group]
+              for tbl_original_name, group in groupby(cursor.execute(sql), key=itemgetter(0))}
         
         logger.debug(f"Found primary keys for {len(pk)} tables")
         return pk
@@ -123,27 +136,25 @@ def get_foreign_keys(connection) -> List[Dict[str, Any]]:
         JOIN sys.columns cr   ON fkc.referenced_object_id = cr.object_id
                              AND fkc.referenced_column_id = cr.column_id
         WHERE LEFT(tp.name,3)<>'sys' AND LEFT(ref.name,3)<>'sys'
-        ORDER BY fk.name"""
+        ORDER BY fk.name, tp.name, ref.name, fkc.constraint_column_id"""
     
     try:
         cursor = connection.cursor()
         rows = cursor.execute(sql).fetchall()
         
-        fk_dict = {}
-        for fk_name, p_tbl_original, fk_col, r_tbl_original, pk_col in rows:
-            key = (fk_name, p_tbl_original, r_tbl_original)
-
-            fk_dict.setdefault(key, {
+        # Rows of one constraint are contiguous thanks to ORDER BY, so build
+        # each FK dict once per group
+        result = []
+        for (fk_name, p_tbl_original, r_tbl_original), group in groupby(rows, key=itemgetter(0, 1, 3)):
+            group = list(group)
+            result.append({
                 'name': fk_name,
                 'parent_table': p_tbl_original,  # Store original name
-                'parent_columns': [], 
+                'parent_columns': [row[2] for row in group], 
                 'referenced_table': r_tbl_original,   # Store original name
-                'referenced_columns': []
+                'referenced_columns': [row[4] for row in group]
             })
-            fk_dict[key]['parent_columns'].append(fk_col)
-            fk_dict[key]['referenced_columns'].append(pk_col)
         
-        result = list(fk_dict.values())
         logger.debug(f"Found {len(result)} foreign key constraints")
         return result
         
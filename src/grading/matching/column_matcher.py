@@ -5,15 +5,126 @@ This module provides intelligent column matching between answer and student sche
 using exact matching, cosine similarity, and semantic analysis.
 """
 
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional, Any
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
 from ..utils.logger import get_logger
 
+try:
+    from rapidfuzz import process as _rf_process
+    from rapidfuzz.distance import Hamming as _Hamming
+except ImportError:
+    _rf_process = None
+
 logger = get_logger(__name__)
 
 
+# Compatible type families: string, numeric, date
+_TYPE_GROUP = {
+    **dict.fromkeys(['char', 'varchar', 'nvarchar', 'nchar', 'text'], 's'),
+    **dict.fromkeys(['int', 'bigint', 'smallint', 'decimal', 'numeric',
+                     'money', 'real', 'float', 'double'], 'n'),
+    **dict.fromkeys(['date', 'datetime', 'smalldatetime', 'timestamp'], 'd'),
+}
+
+
+@lru_cache(maxsize=1024)
+def _types_compatible(type1: str, type2: str) -> bool:
+    """Check if two data types are compatible (cached, type names repeat a lot)."""
+    t1, t2 = type1.lower(), type2.lower()
+    
+    if t1 == t2:
+        return True
+    
+    group = _TYPE_GROUP.get(t1)
+    return group is not None and group == _TYPE_GROUP.get(t2)
+
+
+def _common_char_counts(ans_strings: List[str], stu_strings: List[str]) -> np.ndarray:
+    """Count positions holding the same character, for every (ans, stu) string pair.
+    
+    This is the numerator of the character similarity used by the matchers
+    (sum(a == b for a, b in zip(s1, s2))). Uses RapidFuzz's Hamming distance
+    (padded, so length differences count as mismatches) when available.
+    """
+    ans_lens = np.array([len(s) for s in ans_strings], dtype=np.int64)
+    stu_lens = np.array([len(s) for s in stu_strings], dtype=np.int64)
+    max_lens = np.maximum(ans_lens[:, None], stu_lens[None, :])
+    
+    if _rf_process is not None:
+        distances = _rf_process.cdist(ans_strings, stu_strings, scorer=_Hamming.distance,
+                                      scorer_kwargs={'pad': True}, dtype=np.int64, workers=-1)
+        return max_lens - distances
+    
+    # Fallback: code points padded to a common width with two different
+    # non-character sentinels, so padding never counts as a match
+    width = int(max_lens.max()) if max_lens.size else 0
+    
+    def encode(strings, pad):
+        chars = np.full((len(strings), width), pad, dtype=np.uint32)
+        for i, s in enumerate(strings):
+            chars[i, :len(s)] = np.frombuffer(s.encode('utf-32-le'), dtype=np.uint32)
+        return chars
+    
+    ans_chars = encode(ans_strings, 0xFFFFFFFE)
+    stu_chars = encode(stu_strings, 0xFFFFFFFF)
+    # One row at a time keeps memory at m x width instead of n x m x width
+    return np.array([(row[None, :] == stu_chars).sum(axis=1) for row in ans_chars],
+                    dtype=np.int64).reshape(len(ans_strings), len(stu_strings))
+
+
+# Common column name patterns like id, name, date, etc.
+_COMMON_PATTERNS = ('id', 'name', 'date', 'time', 'code', 'number', 'amount')
+
+
+@lru_cache(maxsize=8192)
+def _pattern_hits(text: str) -> frozenset:
+    """Return the common patterns contained in a column name (cached)."""
+    text = text.lower()
+    return frozenset(p for p in _COMMON_PATTERNS if p in text)
+
+
+@lru_cache(maxsize=8192)
+def _canonical(text: str) -> str:
+    """Convert text to canonical form (cached, column names repeat a lot).
+    
+    Shared by all matchers. lower()+replace() beats a single str.translate
+    pass here, and the cache makes repeat names free anyway.
+    """
+    return text.lower().strip().replace('_', ' ')
+
+
+@lru_cache(maxsize=8192)
+def _exact_key(text: str) -> str:
+    """Key under which two column names count as an exact match.
+    
+    Equal lowercase names and equal canonical names both imply equal
+    canonical names with spaces removed, so this single form covers all
+    three checks of the exact match.
+    """
+    return _canonical(text).replace(' ', '')
+
+
+def _legacy_columns(table_info: Dict) -> List[Tuple[str, str]]:
+    """(name, type) tuples of a table entry: v1 'cols' or SchemaBuilder 'columns'."""
+    cols = table_info.get('cols')
+    return cols if cols is not None else table_info.get('columns', [])
+
+
+def _table_columns(table_info: Dict) -> List[Tuple[str, str]]:
+    """(name, type) pairs of a table entry, whichever schema layout produced it.
+    
+    Reads the same keys as ColumnMatcher._column_arrays so table and column
+    matching always see the same columns.
+    """
+    names = table_info.get('column_names')
+    if names is not None:
+        return list(zip(names, table_info.get('column_types', [])))
+    return _legacy_columns(table_info)
+
+
 class ColumnMatcher:
     """Handles column matching between answer and student table schemas."""
     
@@ -41,68 +152,73 @@ class ColumnMatcher:
         Returns:
             List of column matching results
         """
-        ans_cols = ans_schema.get(ans_table, {}).get('cols', [])
+        ans_names, ans_types = self._column_arrays(ans_schema.get(ans_table, {}))
         
         if stu_table is None:
             return [[ans_table, col, dtype, "—", "—", "—", 0.0, False] 
-                   for col, dtype in ans_cols]
+                   for col, dtype in zip(ans_names, ans_types)]
         
-        stu_cols = stu_schema.get(stu_table, {}).get('cols', [])
+        stu_names, stu_types = self._column_arrays(stu_schema.get(stu_table, {}))
         
-        if not ans_cols or not stu_cols:
+        if not ans_names or not stu_names:
             return [[ans_table, col, dtype, stu_table, "—", "—", 0.0, False] 
-                   for col, dtype in ans_cols]
+                   for col, dtype in zip(ans_names, ans_types)]
         
         # Phase 1: Exact name matching
+        # Index student columns by _exact_key once and take the lowest
+        # still-unmatched index per answer column.
+        stu_by_key = {}
+        for j, stu_col in enumerate(stu_names):
+            stu_by_key.setdefault(_exact_key(stu_col), []).append(j)
+        
         matched_stu_indices = set()
         results = []
         
-        for ans_col, ans_type in ans_cols:
-            exact_match_found = False
-            
-            for j, (stu_col, stu_type) in enumerate(stu_cols):
-                if j in matched_stu_indices:
-                    continue
-                
-                if self._is_exact_match(ans_col, stu_col):
-                    type_match = self._types_compatible(ans_type, stu_type)
-                    results.append([
-                        ans_table, ans_col, ans_type, 
-                        stu_table, stu_col, stu_type, 
-                        1.0, type_match
-                    ])
-                    matched_stu_indices.add(j)
-                    exact_match_found = True
-                    break
+        for ans_col, ans_type in zip(ans_names, ans_types):
+            candidates = stu_by_key.get(_exact_key(ans_col))
             
-            if not exact_match_found:
+            if candidates:
+                j = candidates.pop(0)
+                stu_col, stu_type = stu_names[j], stu_types[j]
+                type_match = self._types_compatible(ans_type, stu_type)
+                results.append([
+                    ans_table, ans_col, ans_type, 
+                    stu_table, stu_col, stu_type, 
+                    1.0, type_match
+                ])
+                matched_stu_indices.add(j)
+            else:
                 results.append([ans_table, ans_col, ans_type, None, None, None, None, None])
         
         # Phase 2: Similarity-based matching for remaining columns
         unmatched_ans = [i for i, result in enumerate(results) if result[6] is None]
-        unmatched_stu = [(j, stu_cols[j][0], stu_cols[j][1]) 
-                        for j in range(len(stu_cols)) 
-                        if j not in matched_stu_indices]
+        unmatched_stu = [j for j in range(len(stu_names)) if j not in matched_stu_indices]
         
         if unmatched_ans and unmatched_stu:
             similarity_matrix = self._calculate_similarity_matrix(
-                [results[i][1] for i in unmatched_ans],  # ans column names
-                [col_name for _, col_name, _ in unmatched_stu]  # stu column names
+                [ans_names[i] for i in unmatched_ans],
+                [stu_names[j] for j in unmatched_stu]
             )
             
-            # Use Hungarian algorithm for optimal assignment
-            cost_matrix = -similarity_matrix
-            row_indices, col_indices = linear_sum_assignment(cost_matrix)
+            if not similarity_matrix.any():
+                # No shared tokens or characters: nothing can be assigned
+                assignment = []
+            elif min(similarity_matrix.shape) == 1:
+                # A single row/column: the best cell is the optimal assignment
+                i, j = np.unravel_index(np.argmax(similarity_matrix), similarity_matrix.shape)
+                assignment = [(i, j)]
+            else:
+                assignment = self._optimal_assignment(similarity_matrix)
             
-            for i, j in zip(row_indices, col_indices):
+            for i, j in assignment:
                 similarity_score = similarity_matrix[i, j]
                 
                 if similarity_score > 0:
                     ans_idx = unmatched_ans[i]
-                    stu_idx, stu_col, stu_type = unmatched_stu[j]
+                    stu_idx = unmatched_stu[j]
                     
-                    ans_col = results[ans_idx][1]
-                    ans_type = results[ans_idx][2]
+                    ans_col, ans_type = ans_names[ans_idx], ans_types[ans_idx]
+                    stu_col, stu_type = stu_names[stu_idx], stu_types[stu_idx]
                     
                     # Enhanced similarity check with semantic analysis if needed
                     final_score = self._enhance_similarity_score(
@@ -128,45 +244,49 @@ class ColumnMatcher:
         
         return results
     
+    @staticmethod
+    def _optimal_assignment(similarity_matrix: np.ndarray) -> List[Tuple[int, int]]:
+        """Return (row, col) pairs maximizing total similarity."""
+        n_rows, n_cols = similarity_matrix.shape
+        
+        # When every row has a strict maximum in a different column, giving
+        # each row its best column is the unique optimum, so any solver would
+        # return exactly this assignment.
+        if n_rows <= n_cols:
+            best_cols = similarity_matrix.argmax(axis=1)
+            if len(set(best_cols.tolist())) == n_rows:
+                best_scores = similarity_matrix[np.arange(n_rows), best_cols]
+                if ((similarity_matrix == best_scores[:, None]).sum(axis=1) == 1).all():
+                    return list(enumerate(best_cols.tolist()))
+        
+        # Use Hungarian algorithm for optimal assignment
+        cost_matrix = -similarity_matrix
+        return list(zip(*linear_sum_assignment(cost_matrix)))
+    
+    @staticmethod
+    def _column_arrays(table_info: Dict) -> Tuple[List[str], List[str]]:
+        """Return (column_names, column_types) for a table entry.
+        
+        Uses the parallel arrays written by SchemaBuilder when present and
+        falls back to splitting the legacy list of (name, type) tuples.
+        """
+        names = table_info.get('column_names')
+        if names is not None:
+            return names, table_info.get('column_types', [])
+        cols = _legacy_columns(table_info)
+        return [col for col, _ in cols], [dtype for _, dtype in cols]
+    
     def _is_exact_match(self, col1: str, col2: str) -> bool:
         """Check if two column names are exact matches."""
-        col1_canonical = self._canonical(col1)
-        col2_canonical = self._canonical(col2)
-        
-        return (
-            col1_canonical == col2_canonical or
-            col1_canonical.replace(' ', '') == col2_canonical.replace(' ', '') or
-            col1.lower() == col2.lower()
-        )
+        return _exact_key(col1) == _exact_key(col2)
     
     def _canonical(self, text: str) -> str:
         """Convert text to canonical form."""
-        return text.lower().strip().replace('_', ' ')
+        return _canonical(text)
     
     def _types_compatible(self, type1: str, type2: str) -> bool:
         """Check if two data types are compatible."""
-        t1, t2 = type1.lower(), type2.lower()
-        
-        if t1 == t2:
-            return True
-        
-        # String types
-        string_types = {'char', 'varchar', 'nvarchar', 'nchar', 'text'}
-        if t1 in string_types and t2 in string_types:
-            return True
-        
-        # Numeric types
-        numeric_types = {'int', 'bigint', 'smallint', 'decimal', 'numeric', 
-                        'money', 'real', 'float', 'double'}
-        if t1 in numeric_types and t2 in numeric_types:
-            return True
-        
-        # Date types
-        date_types = {'date', 'datetime', 'smalldatetime', 'timestamp'}
-        if t1 in date_types and t2 in date_types:
-            return True
-        
-        return False
+        return _types_compatible(type1, type2)
     
     def _calculate_similarity_matrix(self, 
                                    ans_cols: List[str], 
@@ -176,21 +296,49 @@ class ColumnMatcher:
             return np.zeros((len(ans_cols), len(stu_cols)))
         
         similarity_matrix = np.zeros((len(ans_cols), len(stu_cols)))
-        
-        for i, ans_col in enumerate(ans_cols):
-            for j, stu_col in enumerate(stu_cols):
-                similarity_matrix[i, j] = self._column_similarity(ans_col, stu_col)
-        
+
+        # Precompute token sets and lowercase names once per column instead of
+        # once per cell; the loop body below is _column_similarity inlined.
+        ans_tokens = [frozenset(_canonical(c).split()) for c in ans_cols]
+        stu_tokens = [frozenset(_canonical(c).split()) for c in stu_cols]
+        ans_lower = [c.lower() for c in ans_cols]
+        stu_lower = [c.lower() for c in stu_cols]
+        common_chars = _common_char_counts(ans_lower, stu_lower)
+
+        for i, (tokens1, str1) in enumerate(zip(ans_tokens, ans_lower)):
+            if not tokens1:
+                continue
+            row = similarity_matrix[i]
+            common_row = common_chars[i]
+            for j, (tokens2, str2) in enumerate(zip(stu_tokens, stu_lower)):
+                if not tokens2:
+                    continue
+
+                jaccard_similarity = len(tokens1 & tokens2) / len(tokens1 | tokens2)
+
+                if str1 == str2:
+                    char_similarity = 1.0
+                else:
+                    char_similarity = common_row[j] / max(len(str1), len(str2))
+
+                row[j] = max(jaccard_similarity, char_similarity)
+
         return similarity_matrix
     
     def _column_similarity(self, col1: str, col2: str) -> float:
         """Calculate similarity between two column names."""
-        # Token-based similarity
-        tokens1 = set(self._canonical(col1).split())
-        tokens2 = set(self._canonical(col2).split())
+        canonical1 = _canonical(col1)
+        canonical2 = _canonical(col2)
         
-        if not tokens1 or not tokens2:
+        # Fast outs: no tokens on one side, or identical canonical names
+        if not canonical1.strip() or not canonical2.strip():
             return 0.0
+        if canonical1 == canonical2:
+            return 1.0
+        
+        # Token-based similarity
+        tokens1 = set(canonical1.split())
+        tokens2 = set(canonical2.split())
         
         intersection = len(tokens1 & tokens2)
         union = len(tokens1 | tokens2)
@@ -216,11 +364,8 @@ class ColumnMatcher:
         if max_len == 0:
             return 1.0
         
-        # Count common characters
-        common_chars = 0
-        for i, char in enumerate(str1_lower):
-            if i < len(str2_lower) and char == str2_lower[i]:
-                common_chars += 1
+        # Count common characters (zip stops at the shorter string)
+        common_chars = sum(map(str.__eq__, str1_lower, str2_lower))
         
         return common_chars / max_len
     
@@ -242,18 +387,7 @@ class ColumnMatcher:
     
     def _has_common_patterns(self, col1: str, col2: str) -> bool:
         """Check if two column names have common patterns."""
-        # Check for common prefixes/suffixes
-        col1_lower = col1.lower()
-        col2_lower = col2.lower()
-        
-        # Common patterns like id, name, date, etc.
-        patterns = ['id', 'name', 'date', 'time', 'code', 'number', 'amount']
-        
-        for pattern in patterns:
-            if pattern in col1_lower and pattern in col2_lower:
-                return True
-        
-        return False
+        return bool(_pattern_hits(col1) & _pattern_hits(col2))
     
     def match_all_tables(self, 
                         ans_schema: Dict[str, Dict],
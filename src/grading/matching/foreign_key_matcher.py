@@ -5,16 +5,27 @@ This module handles comparison and matching of foreign key constraints
 between answer and student database schemas.
 """
 
+import csv
+import logging
 from typing import Dict, List, Tuple, Optional, Any
-import pandas as pd
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 from ..utils.logger import get_logger
+from .column_matcher import _canonical, _common_char_counts
 
 logger = get_logger(__name__)
 
+# Columns of the FK comparison CSV (keys of each result dict)
+FK_RESULT_FIELDS = ['answer_fk', 'student_fk', 'similarity', 'is_matched']
+
 
 class ForeignKeyMatcher:
     """Handles foreign key matching between answer and student schemas."""
     
+    # Connections whose foreign keys are kept (answer DB + a few students);
+    # the oldest entry is evicted so closed connections are not pinned for a whole batch
+    FK_CACHE_SIZE = 4
+    
     def __init__(self, similarity_threshold: float = 0.85):
         """Initialize the foreign key matcher.
         
@@ -22,37 +33,70 @@ class ForeignKeyMatcher:
             similarity_threshold: Minimum similarity score for FK matching
         """
         self.similarity_threshold = similarity_threshold
+        # {id(connection): (connection, fk_list)}, at most FK_CACHE_SIZE entries; the
+        # connection is kept so its id cannot be reused by another connection while cached
+        self._fk_cache: Dict[int, Tuple[Any, List[Dict[str, Any]]]] = {}
     
-    def get_foreign_keys(self, connection) -> List[Dict[str, Any]]:
+    def invalidate(self, connection) -> None:
+        """Drop cached foreign keys for a connection (e.g. after ForeignKeyInfo changes).
+        
+        Args:
+            connection: Database connection
+        """
+        self._fk_cache.pop(id(connection), None)
+    
+    def get_foreign_keys(self, connection, use_cache: bool = False) -> List[Dict[str, Any]]:
         """Extract foreign key information from database.
         
         Args:
             connection: Database connection
+            use_cache: Reuse/keep the result for this connection, so repeated
+                       comparisons against the same (answer) database do not
+                       re-query ForeignKeyInfo
         
         Returns:
             List of foreign key dictionaries
         """
+        if use_cache:
+            cached = self._fk_cache.get(id(connection))
+            if cached is not None and cached[0] is connection:
+                return cached[1]
+        
         try:
+            # "<> ''" also filters NULLs, so incomplete rows never leave the server
             sql = """
                 SELECT ParentTable, RefTable, FKColumns, PKColumns 
                 FROM ForeignKeyInfo
+                WHERE ParentTable <> '' AND RefTable <> ''
+                  AND FKColumns <> '' AND PKColumns <> ''
             """
             cursor = connection.cursor()
+            cursor.arraysize = 1000
+            cursor.execute(sql)
             fk_list = []
             
-            for parent, ref, fk_cols, pk_cols in cursor.execute(sql).fetchall():
-                if parent and ref and fk_cols and pk_cols:
-                    try:
-                        fk_list.append({
-                            'parent_table': parent,
-                            'ref_table': ref,
-                            'fk_cols': fk_cols.split(','),
-                            'pk_cols': pk_cols.split(',')
-                        })
-                    except Exception as e:
-                        logger.warning(f"Failed to parse FK: {e}")
-                        continue
+            while True:
+                rows = cursor.fetchmany()
+                if not rows:
+                    break
+                for parent, ref, fk_cols, pk_cols in rows:
+                    fk_cols = fk_cols.split(',')
+                    pk_cols = pk_cols.split(',')
+                    fk_list.append({
+                        'parent_table': parent,
+                        'ref_table': ref,
+                        'fk_cols': fk_cols,
+                        'pk_cols': pk_cols,
+                        # Canonical column names, computed once per FK
+                        'fk_cols_canonical': tuple(_canonical(c) for c in fk_cols),
+                        'pk_cols_canonical': tuple(_canonical(c) for c in pk_cols)
+                    })
             
+            if use_cache:
+                self._fk_cache.pop(id(connection), None)
+                if len(self._fk_cache) >= self.FK_CACHE_SIZE:
+                    self._fk_cache.pop(next(iter(self._fk_cache)))
+                self._fk_cache[id(connection)] = (connection, fk_list)
             return fk_list
             
         except Exception as e:
@@ -72,16 +116,31 @@ class ForeignKeyMatcher:
         Returns:
             Formatted foreign key description string
         """
-        parent_canonical = self._canonical(parent_table)
-        ref_canonical = self._canonical(ref_table)
-        fk_cols_canonical = ','.join(self._canonical(c) for c in fk_cols)
-        pk_cols_canonical = ','.join(self._canonical(c) for c in pk_cols)
+        parent_canonical = _canonical(parent_table)
+        ref_canonical = _canonical(ref_table)
+        fk_cols_canonical = ','.join(_canonical(c) for c in fk_cols)
+        pk_cols_canonical = ','.join(_canonical(c) for c in pk_cols)
         
         return f"{parent_canonical}({fk_cols_canonical}) -> {ref_canonical}({pk_cols_canonical})"
     
+    def _fk_string(self, fk: Dict[str, Any]) -> str:
+        """Create the description string for an FK dict from get_foreign_keys.
+        
+        Uses the precomputed canonical column tuples when present, so only
+        the table names are canonicalized here.
+        """
+        fk_cols_c = fk.get('fk_cols_canonical')
+        pk_cols_c = fk.get('pk_cols_canonical')
+        if fk_cols_c is None or pk_cols_c is None:
+            return self.format_fk_string(fk['parent_table'], fk['ref_table'],
+                                         fk['fk_cols'], fk['pk_cols'])
+        
+        return (f"{_canonical(fk['parent_table'])}({','.join(fk_cols_c)}) -> "
+                f"{_canonical(fk['ref_table'])}({','.join(pk_cols_c)})")
+    
     def _canonical(self, text: str) -> str:
         """Convert text to canonical form."""
-        return text.lower().strip().replace('_', ' ')
+        return _canonical(text)
     
     def compare_foreign_keys(self, 
                            ans_connection, 
@@ -101,7 +160,7 @@ class ForeignKeyMatcher:
         """
         try:
             # Get foreign keys from both schemas
-            ans_fks = self.get_foreign_keys(ans_connection)
+            ans_fks = self.get_foreign_keys(ans_connection, use_cache=True)
             if not ans_fks:
                 logger.warning("No foreign keys found in answer database")
                 return [], 0.0
@@ -112,45 +171,31 @@ class ForeignKeyMatcher:
                 return [], 0.0
             
             # Map student table names using table mapping
-            reverse_mapping = {v: k for k, v in table_mapping.items() if v is not None}
+            # Keys are lowercased once so lookups are case-insensitive
+            reverse_mapping = {v.lower(): k for k, v in table_mapping.items() if v}
             
-            stu_fks_mapped = []
-            for fk in stu_fks:
-                parent = reverse_mapping.get(fk['parent_table'].lower(), fk['parent_table'])
-                ref = reverse_mapping.get(fk['ref_table'].lower(), fk['ref_table'])
-                stu_fks_mapped.append({
-                    'parent_table': parent,
-                    'ref_table': ref,
-                    'fk_cols': fk['fk_cols'],
-                    'pk_cols': fk['pk_cols']
-                })
+            stu_fks_mapped = [{
+                'parent_table': reverse_mapping.get(fk['parent_table'].lower(), fk['parent_table']),
+                'ref_table': reverse_mapping.get(fk['ref_table'].lower(), fk['ref_table']),
+                'fk_cols': fk['fk_cols'],
+                'pk_cols': fk['pk_cols'],
+                'fk_cols_canonical': fk.get('fk_cols_canonical'),
+                'pk_cols_canonical': fk.get('pk_cols_canonical')
+            } for fk in stu_fks]
             
             # Create description strings for all foreign keys
-            ans_strings = [
-                self.format_fk_string(fk['parent_table'], fk['ref_table'], 
-                                     fk['fk_cols'], fk['pk_cols'])
-                for fk in ans_fks
-            ]
-            
-            stu_strings = [
-                self.format_fk_string(fk['parent_table'], fk['ref_table'],
-                                     fk['fk_cols'], fk['pk_cols'])
-                for fk in stu_fks_mapped
-            ]
-            
-            # Calculate similarity matrix
-            similarity_matrix = self._calculate_similarity_matrix(ans_strings, stu_strings)
+            ans_strings = [self._fk_string(fk) for fk in ans_fks]
+            stu_strings = [self._fk_string(fk) for fk in stu_fks_mapped]
             
-            # Find optimal matching
-            results, total_matches = self._find_optimal_matching(
-                ans_strings, stu_strings, similarity_matrix
-            )
+            results, total_matches = self._match_fk_strings(ans_strings, stu_strings)
             
             # Save results to CSV if requested
             if output_file and results:
                 try:
-                    df = pd.DataFrame(results)
-                    df.to_csv(output_file, index=False, encoding='utf-8-sig')
+                    with open(output_file, 'w', newline='', encoding='utf-8-sig') as f:
+                        writer = csv.DictWriter(f, fieldnames=FK_RESULT_FIELDS)
+                        writer.writeheader()
+                        writer.writerows(results)
                     logger.info(f"Saved foreign key results to {output_file}")
                 except Exception as e:
                     logger.warning(f"Failed to save FK results to CSV: {e}")
@@ -164,23 +209,103 @@ class ForeignKeyMatcher:
             logger.error(f"Error comparing foreign keys: {e}")
             return [], 0.0
     
+    def _match_fk_strings(self, 
+                          ans_strings: List[str], 
+                          stu_strings: List[str]) -> Tuple[List[Dict], int]:
+        """Match FK strings: identical strings first, then the fuzzy pass on the rest."""
+        # Identical (already canonical) strings score 1.0 and are paired up front
+        stu_index = {}
+        for j, stu_str in enumerate(stu_strings):
+            stu_index.setdefault(stu_str, []).append(j)
+        
+        exact = {}
+        for i, ans_str in enumerate(ans_strings):
+            candidates = stu_index.get(ans_str)
+            if candidates and ans_str.split():
+                exact[i] = candidates.pop(0)
+        
+        # Only the remaining strings go through the similarity matrix
+        rest_ans = [i for i in range(len(ans_strings)) if i not in exact]
+        used_stu = set(exact.values())
+        rest_stu = [j for j in range(len(stu_strings)) if j not in used_stu]
+        
+        rest_ans_strings = [ans_strings[i] for i in rest_ans]
+        rest_stu_strings = [stu_strings[j] for j in rest_stu]
+        similarity_matrix = self._calculate_similarity_matrix(rest_ans_strings, rest_stu_strings)
+        rest_results, total_matches = self._find_optimal_matching(
+            rest_ans_strings, rest_stu_strings, similarity_matrix
+        )
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        results = [None] * len(ans_strings)
+        for i, j in exact.items():
+            results[i] = {
+                'answer_fk': ans_strings[i],
+                'student_fk': stu_strings[j],
+                'similarity': 1.0,
+                'is_matched': True
+            }
+            if debug:
+                logger.debug("Matched FK: %s -> %s (exact)", ans_strings[i], stu_strings[j])
+        for i, result in zip(rest_ans, rest_results):
+            results[i] = result
+        
+        return results, total_matches + len(exact)
+    
     def _calculate_similarity_matrix(self, 
                                    ans_strings: List[str], 
                                    stu_strings: List[str]) -> List[List[float]]:
-        """Calculate similarity matrix between FK description strings."""
-        similarity_matrix = []
+        """Calculate similarity matrix between FK description strings.
         
-        for ans_str in ans_strings:
-            row = []
-            for stu_str in stu_strings:
-                score = self._string_similarity(ans_str, stu_str)
-                row.append(score)
-            similarity_matrix.append(row)
+        Same scores as _string_similarity for every pair, computed for all
+        pairs at once: token Jaccard from token bitsets and character
+        similarity from _common_char_counts.
+        """
+        if not ans_strings or not stu_strings:
+            return [[] for _ in ans_strings]
+        
+        ans_tokens = [set(s.split()) for s in ans_strings]
+        stu_tokens = [set(s.split()) for s in stu_strings]
+        
+        # Encode each string as a row of token flags over a shared vocabulary:
+        # intern tokens to ids once, then set every flag with a single scatter
+        vocab = {}
+        token_ids = [[vocab.setdefault(tok, len(vocab)) for tok in tokens]
+                     for tokens in ans_tokens + stu_tokens]
+        row_ids = np.repeat(np.arange(len(token_ids)), [len(ids) for ids in token_ids])
+        col_ids = np.fromiter((i for ids in token_ids for i in ids), dtype=np.intp, count=len(row_ids))
+        
+        bits = np.zeros((len(token_ids), len(vocab)))
+        bits[row_ids, col_ids] = 1.0
+        ans_bits, stu_bits = bits[:len(ans_strings)], bits[len(ans_strings):]
+        
+        intersection = ans_bits @ stu_bits.T
+        union = ans_bits.sum(axis=1)[:, None] + stu_bits.sum(axis=1)[None, :] - intersection
+        jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
         
-        return similarity_matrix
+        # Character similarity
+        common_chars = _common_char_counts(ans_strings, stu_strings)
+        ans_lens = np.array([len(s) for s in ans_strings])
+        stu_lens = np.array([len(s) for s in stu_strings])
+        max_lens = np.maximum(ans_lens[:, None], stu_lens[None, :])
+        char_similarity = np.divide(common_chars, max_lens, out=np.zeros(common_chars.shape), where=max_lens > 0)
+        
+        similarity_matrix = np.maximum(jaccard, char_similarity)
+        identical = (common_chars == max_lens) & (ans_lens[:, None] == stu_lens[None, :])
+        similarity_matrix[identical] = 1.0
+        
+        has_tokens_ans = np.array([bool(t) for t in ans_tokens])
+        has_tokens_stu = np.array([bool(t) for t in stu_tokens])
+        similarity_matrix[~(has_tokens_ans[:, None] & has_tokens_stu[None, :])] = 0.0
+        
+        return similarity_matrix.tolist()
     
     def _string_similarity(self, str1: str, str2: str) -> float:
         """Calculate similarity between two FK description strings."""
+        # Character-level similarity for exact matches (strings without tokens score 0)
+        if str1 == str2:
+            return 1.0 if str1.split() else 0.0
+        
         # Simple token-based similarity
         tokens1 = set(str1.split())
         tokens2 = set(str2.split())
@@ -193,12 +318,12 @@ class ForeignKeyMatcher:
         
         jaccard_similarity = intersection / union if union > 0 else 0.0
         
-        # Character-level similarity for exact matches
-        if str1 == str2:
-            return 1.0
+        # Nothing can beat a full token match, skip the character pass
+        if jaccard_similarity >= 1.0:
+            return jaccard_similarity
         
         # Enhanced similarity for partial matches
-        common_chars = sum(1 for a, b in zip(str1, str2) if a == b)
+        common_chars = sum(map(str.__eq__, str1, str2))
         max_len = max(len(str1), len(str2))
         char_similarity = common_chars / max_len if max_len > 0 else 0.0
         
@@ -212,22 +337,6 @@ class ForeignKeyMatcher:
         n = len(ans_strings)
         m = len(stu_strings)
         
-        # Find all possible matches above threshold
-        possible_matches = []
-        for i in range(n):
-            for j in range(m):
-                score = similarity_matrix[i][j]
-                if score >= self.similarity_threshold:
-                    possible_matches.append((score, i, j))
-        
-        # Sort by score descending
-        possible_matches.sort(reverse=True)
-        
-        # Greedy matching ensuring 1-1 correspondence
-        used_ans = set()
-        used_stu = set()
-        total_matches = 0
-        
         # Initialize results
         results = []
         for i in range(n):
@@ -238,18 +347,29 @@ class ForeignKeyMatcher:
                 'is_matched': False
             })
         
-        # Apply greedy matching
-        for score, i, j in possible_matches:
-            if i not in used_ans and j not in used_stu:
-                used_ans.add(i)
-                used_stu.add(j)
-                results[i].update({
-                    'student_fk': stu_strings[j],
-                    'similarity': score,
-                    'is_matched': True
-                })
-                total_matches += 1
-                logger.debug(f"Matched FK: {ans_strings[i]} -> {stu_strings[j]} (score: {score:.3f})")
+        if n == 0 or m == 0:
+            return results, 0
+        
+        # Optimal 1-1 assignment (Hungarian) over scores above threshold;
+        # pairs below threshold cost nothing and are filtered out afterwards
+        scores = np.asarray(similarity_matrix, dtype=float)
+        eligible = scores >= self.similarity_threshold
+        row_indices, col_indices = linear_sum_assignment(-np.where(eligible, scores, 0.0))
+        
+        debug = logger.isEnabledFor(logging.DEBUG)
+        total_matches = 0
+        for i, j in zip(row_indices, col_indices):
+            if not eligible[i, j]:
+                continue
+            score = similarity_matrix[i][j]
+            results[i].update({
+                'student_fk': stu_strings[j],
+                'similarity': score,
+                'is_matched': True
+            })
+            total_matches += 1
+            if debug:
+                logger.debug("Matched FK: %s -> %s (score: %.3f)", ans_strings[i], stu_strings[j], score)
         
         return results, total_matches
 
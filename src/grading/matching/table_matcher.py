@@ -10,6 +10,7 @@ import numpy as np
 from scipy.optimize import linear_sum_assignment
 
 from ..utils.logger import get_logger
+from .column_matcher import _canonical, _exact_key, _types_compatible, _table_columns, _TYPE_GROUP
 
 logger = get_logger(__name__)
 
@@ -41,73 +42,73 @@ class TableMatcher:
         Returns:
             int: Number of matching column pairs
         """
-        count = 0
-        used_stu_cols = set()
-        
-        for ac, at in ans_cols:
-            for i, (sc, st) in enumerate(stu_cols):
-                if i in used_stu_cols:
-                    continue
-                    
-                # Check column name matching using multiple methods
-                smart_score = self._smart_token_match(ac, sc)
-                exact_match = (
-                    self._canonical(ac) == self._canonical(sc) or
-                    self._canonical(ac).replace(' ', '') == self._canonical(sc).replace(' ', '') or
-                    ac.lower() == sc.lower()
-                )
-                
-                # Match if exact or smart_token_match score is high enough
-                if exact_match or smart_score >= match_threshold:
-                    # Check type compatibility (flexible)
-                    if self._types_compatible(at, st):
-                        count += 1
-                        used_stu_cols.add(i)
-                        break
-        return count
-    
-    def _smart_token_match(self, str1: str, str2: str) -> float:
-        """Calculate smart token matching score between two strings."""
-        # Simplified implementation - can be enhanced with fuzzy matching
-        str1_tokens = set(str1.lower().split())
-        str2_tokens = set(str2.lower().split())
+        if not ans_cols or not stu_cols:
+            return 0
         
-        if not str1_tokens or not str2_tokens:
+        return self._count_matching_features(
+            self._column_features(ans_cols), self._column_features(stu_cols), match_threshold
+        )
+    
+    def _column_features(self, cols: List[Tuple[str, str]]) -> Dict[str, object]:
+        """Per-column data used by count_matching_columns, computed once per table."""
+        types = np.array([dtype.lower() for _, dtype in cols], dtype=object)
+        return {
+            # Every exact check (canonical, canonical without spaces, lowercase)
+            # implies equal canonical names with spaces removed
+            'keys': np.array([_exact_key(name) for name, _ in cols], dtype=object),
+            # Token sets for _smart_token_match
+            'tokens': [set(name.lower().split()) for name, _ in cols],
+            'types': types,
+            'groups': np.array([_TYPE_GROUP.get(t, '') for t in types], dtype=object),
+        }
+    
+    def _count_matching_features(self, ans: Dict[str, object], stu: Dict[str, object],
+                                 match_threshold: int = 70) -> int:
+        """count_matching_columns on precomputed _column_features."""
+        if not len(ans['keys']) or not len(stu['keys']):
+            return 0
+        
+        # Match if exact or smart_token_match score is high enough
+        name_matrix = (ans['keys'][:, None] == stu['keys'][None, :]) | np.array([
+            [self._token_score(t1, t2) >= match_threshold for t2 in stu['tokens']]
+            for t1 in ans['tokens']
+        ], dtype=bool)
+        
+        # Check type compatibility (flexible), same rule as _types_compatible
+        ans_groups = ans['groups'][:, None]
+        type_matrix = ((ans['types'][:, None] == stu['types'][None, :]) |
+                       ((ans_groups == stu['groups'][None, :]) & (ans_groups != '')))
+        
+        # Maximum 1-1 matching over compatible pairs (optimal, not first-fit)
+        match_matrix = name_matrix & type_matrix
+        if not match_matrix.any():
+            return 0
+        row_indices, col_indices = linear_sum_assignment(-match_matrix.astype(float))
+        return int(match_matrix[row_indices, col_indices].sum())
+    
+    @staticmethod
+    def _token_score(tokens1: set, tokens2: set) -> float:
+        """Jaccard score (0-100) of two precomputed token sets."""
+        if not tokens1 or not tokens2:
             return 0.0
-            
-        intersection = len(str1_tokens & str2_tokens)
-        union = len(str1_tokens | str2_tokens)
+        
+        intersection = len(tokens1 & tokens2)
+        union = len(tokens1 | tokens2)
         
         return (intersection / union) * 100 if union > 0 else 0.0
     
+    def _smart_token_match(self, str1: str, str2: str) -> float:
+        """Calculate smart token matching score between two strings."""
+        # Simplified implementation - can be enhanced with fuzzy matching
+        return self._token_score(set(str1.lower().split()), set(str2.lower().split()))
+    
     def _canonical(self, text: str) -> str:
         """Convert text to canonical form."""
-        return text.lower().strip().replace('_', ' ')
+        return _canonical(text)
     
     def _types_compatible(self, type1: str, type2: str) -> bool:
         """Check if two data types are compatible."""
-        t1, t2 = type1.lower(), type2.lower()
-        
-        if t1 == t2:
-            return True
-        
-        # String types
-        string_types = {'char', 'varchar', 'nvarchar', 'nchar', 'text'}
-        if t1 in string_types and t2 in string_types:
-            return True
-        
-        # Numeric types
-        numeric_types = {'int', 'bigint', 'smallint', 'decimal', 'numeric', 
-                        'money', 'real', 'float', 'double'}
-        if t1 in numeric_types and t2 in numeric_types:
-            return True
-        
-        # Date types
-        date_types = {'date', 'datetime', 'smalldatetime', 'timestamp'}
-        if t1 in date_types and t2 in date_types:
-            return True
-        
-        return False
+        return _types_compatible(type1, type2)
     
     def match_tables(self, 
                     ans_schema: Dict[str, Dict], 
@@ -129,13 +130,10 @@ class TableMatcher:
             return {table: None for table in ans_tables}
         
         # Create column match matrix
-        col_match_matrix = np.zeros((len(ans_tables), len(stu_tables)))
-        for i, ans_table in enumerate(ans_tables):
-            for j, stu_table in enumerate(stu_tables):
-                col_match_matrix[i, j] = self.count_matching_columns(
-                    ans_schema[ans_table].get('cols', []),
-                    stu_schema[stu_table].get('cols', [])
-                )
+        col_match_matrix = self._column_match_matrix(
+            [_table_columns(ans_schema[t]) for t in ans_tables],
+            [_table_columns(stu_schema[t]) for t in stu_tables]
+        )
         
         # Calculate cosine similarity (simplified - can be enhanced with embeddings)
         sim_matrix = self._calculate_similarity_matrix(ans_schema, stu_schema)
@@ -162,13 +160,12 @@ class TableMatcher:
                 
                 if (has_col_match and has_medium_similarity) or has_high_similarity:
                     mapping[ans_table] = stu_table
-                    logger.info(f"Matched table: {ans_table} -> {stu_table} "
-                              f"(cols: {col_match_matrix[i,j]}, sim: {sim_matrix[i,j]:.3f})")
+                    logger.info("Matched table: %s -> %s (cols: %s, sim: %.3f)",
+                                ans_table, stu_table, col_match_matrix[i, j], sim_matrix[i, j])
                 else:
                     mapping[ans_table] = None
-                    logger.info(f"No match for table: {ans_table} "
-                              f"(best candidate: {stu_table}, cols={col_match_matrix[i,j]}, "
-                              f"sim={sim_matrix[i,j]:.3f})")
+                    logger.info("No match for table: %s (best candidate: %s, cols=%s, sim=%.3f)",
+                                ans_table, stu_table, col_match_matrix[i, j], sim_matrix[i, j])
             else:
                 mapping[ans_table] = None
         
@@ -179,6 +176,41 @@ class TableMatcher:
         
         return mapping
     
+    def _column_match_matrix(self, 
+                             ans_table_cols: List[List[Tuple[str, str]]], 
+                             stu_table_cols: List[List[Tuple[str, str]]]) -> np.ndarray:
+        """count_matching_columns for every (answer table, student table) pair.
+        
+        A column pair can only match if the names share an exact key or a
+        token, so an inverted index over answer keys/tokens finds the table
+        pairs worth counting; every other pair stays 0.
+        """
+        col_match_matrix = np.zeros((len(ans_table_cols), len(stu_table_cols)))
+        
+        ans_features = [self._column_features(cols) for cols in ans_table_cols]
+        stu_features = [self._column_features(cols) for cols in stu_table_cols]
+        
+        index = {}
+        for i, features in enumerate(ans_features):
+            for key in features['keys']:
+                index.setdefault(('k', key), set()).add(i)
+            for tokens in features['tokens']:
+                for tok in tokens:
+                    index.setdefault(('t', tok), set()).add(i)
+        
+        for j, features in enumerate(stu_features):
+            candidates = set()
+            for key in features['keys']:
+                candidates |= index.get(('k', key), set())
+            for tokens in features['tokens']:
+                for tok in tokens:
+                    candidates |= index.get(('t', tok), set())
+            
+            for i in candidates:
+                col_match_matrix[i, j] = self._count_matching_features(ans_features[i], features)
+        
+        return col_match_matrix
+    
     def _calculate_similarity_matrix(self, 
                                    ans_schema: Dict[str, Dict], 
                                    stu_schema: Dict[str, Dict]) -> np.ndarray:
@@ -189,26 +221,54 @@ class TableMatcher:
         ans_tables = list(ans_schema.keys())
         stu_tables = list(stu_schema.keys())
         
-        similarity_matrix = np.zeros((len(ans_tables), len(stu_tables)))
+        ans_names = [_canonical(t) for t in ans_tables]
+        stu_names = [_canonical(t) for t in stu_tables]
         
-        for i, ans_table in enumerate(ans_tables):
-            for j, stu_table in enumerate(stu_tables):
-                # Simple similarity based on table name and column names
-                name_sim = self._name_similarity(ans_table, stu_table)
-                
-                ans_cols = [col[0] for col in ans_schema[ans_table].get('cols', [])]
-                stu_cols = [col[0] for col in stu_schema[stu_table].get('cols', [])]
-                col_sim = self._column_set_similarity(ans_cols, stu_cols)
-                
-                # Combine similarities
-                similarity_matrix[i, j] = (name_sim + col_sim) / 2
+        # Simple similarity based on table name (same as _name_similarity) ...
+        name_sim = self._jaccard_matrix([set(n.split()) for n in ans_names],
+                                        [set(n.split()) for n in stu_names])
+        name_sim[np.array(ans_names, dtype=object)[:, None] == np.array(stu_names, dtype=object)[None, :]] = 1.0
         
-        return similarity_matrix
+        # ... and column names (same as _column_set_similarity)
+        col_sim = self._jaccard_matrix(
+            [{_canonical(col[0]) for col in _table_columns(ans_schema[t])} for t in ans_tables],
+            [{_canonical(col[0]) for col in _table_columns(stu_schema[t])} for t in stu_tables]
+        )
+        
+        # Combine similarities
+        return (name_sim + col_sim) / 2
+    
+    @staticmethod
+    def _jaccard_matrix(ans_sets: List[set], stu_sets: List[set]) -> np.ndarray:
+        """Jaccard similarity of every (ans, stu) set pair; 0.0 when either set is empty.
+        
+        Sets are encoded as rows of flags over a shared vocabulary so all
+        intersections come from one matrix product.
+        """
+        vocab = {}
+        for items in ans_sets + stu_sets:
+            for item in items:
+                vocab.setdefault(item, len(vocab))
+        
+        ans_bits = np.zeros((len(ans_sets), len(vocab)))
+        stu_bits = np.zeros((len(stu_sets), len(vocab)))
+        for bits, sets in ((ans_bits, ans_sets), (stu_bits, stu_sets)):
+            for i, items in enumerate(sets):
+                bits[i, [vocab[item] for item in items]] = 1.0
+        
+        intersection = ans_bits @ stu_bits.T
+        ans_sizes = ans_bits.sum(axis=1)[:, None]
+        stu_sizes = stu_bits.sum(axis=1)[None, :]
+        union = ans_sizes + stu_sizes - intersection
+        
+        jaccard = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+        jaccard[(ans_sizes == 0) | (stu_sizes == 0)] = 0.0
+        return jaccard
     
     def _name_similarity(self, name1: str, name2: str) -> float:
         """Calculate similarity between two table names."""
-        name1_canonical = self._canonical(name1)
-        name2_canonical = self._canonical(name2)
+        name1_canonical = _canonical(name1)
+        name2_canonical = _canonical(name2)
         
         if name1_canonical == name2_canonical:
             return 1.0
@@ -230,8 +290,8 @@ class TableMatcher:
         if not cols1 or not cols2:
             return 0.0
         
-        canonical_cols1 = {self._canonical(col) for col in cols1}
-        canonical_cols2 = {self._canonical(col) for col in cols2}
+        canonical_cols1 = {_canonical(col) for col in cols1}
+        canonical_cols2 = {_canonical(col) for col in cols2}
         
         intersection = len(canonical_cols1 & canonical_cols2)
         union = len(canonical_cols1 | canonical_cols2)
@@ -3,10 +3,19 @@ Configuration management
 """
 
 import os
+import copy
 import json
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from pathlib import Path
 
+try:
+    import orjson  # optional, faster JSON parsing
+except ImportError:
+    orjson = None
+
+# Parsed config files keyed by (path, mtime_ns, size)
+_CFG_CACHE: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+
 
 class Config:
     """Configuration manager for the grading system"""
@@ -21,8 +30,15 @@ class Config:
         config_file = Path(self.config_path)
         
         if config_file.exists():
-            with open(config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            stat = config_file.stat()
+            key = (str(config_file.resolve()), stat.st_mtime_ns, stat.st_size)
+            
+            if key not in _CFG_CACHE:
+                raw = config_file.read_bytes()
+                _CFG_CACHE[key] = orjson.loads(raw) if orjson else json.loads(raw.decode('utf-8'))
+            
+            # Each instance gets its own copy since set() mutates the dict
+            return copy.deepcopy(_CFG_CACHE[key])
         else:
             # Return default configuration
             return self._get_default_config()
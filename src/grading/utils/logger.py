@@ -4,7 +4,16 @@ Logging utilities
 
 import logging
 import sys
-from typing import Optional
+from typing import Optional, Set
+
+
+# Shared formatter for console handlers created by get_logger
+_FORMATTER = logging.Formatter(
+    '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+# Names of loggers already configured by get_logger
+_CONFIGURED: Set[str] = set()
 
 
 def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
@@ -18,6 +27,9 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
     Returns:
         Configured logger instance
     """
+    if name in _CONFIGURED:
+        return logging.getLogger(name)
+    
     logger = logging.getLogger(name)
     
     if not logger.handlers:
@@ -29,11 +41,7 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
         handler = logging.StreamHandler(sys.stdout)
         handler.setLevel(log_level)
         
-        # Create formatter
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler.setFormatter(formatter)
+        handler.setFormatter(_FORMATTER)
         
         # Add handler to logger
         logger.addHandler(handler)
@@ -41,6 +49,7 @@ def get_logger(name: str, level: Optional[str] = None) -> logging.Logger:
         # Prevent duplicate logs
         logger.propagate = False
     
+    _CONFIGURED.add(name)
     return logger
 
 
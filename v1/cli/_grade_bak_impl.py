@@ -0,0 +1,54 @@
+"""
+Phần chấm điểm của grade_bak, tách khỏi giao diện hỏi tham số (Tk).
+"""
+import os
+import sys
+
+from schema_grader.db.answer_schema import restore_answer_schema
+from schema_grader.grading.pipeline import run_batch
+
+
+def find_dapan_bak(bak_folder: str):
+    """Tìm file dapan.bak (không phân biệt hoa thường) trong thư mục."""
+    for f in os.listdir(bak_folder):
+        if f.lower() == 'dapan.bak':
+            path = os.path.join(bak_folder, f)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def run(bak_folder: str, data_folder: str, server: str, user: str, password: str,
+        use_cache: bool = True, reuse_restored: bool = False):
+    """Restore đáp án và chấm toàn bộ file .bak trong bak_folder.
+
+    Args:
+        use_cache: False để bỏ qua cache schema đáp án trong pairs_out
+        reuse_restored: True để giữ database sinh viên sau khi chấm và bỏ qua restore
+                        ở lần chạy sau nếu file .bak không đổi (fingerprint lưu trong data_folder)
+
+    Returns:
+        Danh sách kết quả từ run_batch
+    """
+    dapan_bak_path = find_dapan_bak(bak_folder)
+    if not dapan_bak_path:
+        print("Không tìm thấy file dapan.bak trong thư mục đã chọn. Thoát chương trình.")
+        sys.exit(1)
+    out_dir = os.path.join(bak_folder, "pairs_out")
+    os.makedirs(out_dir, exist_ok=True)
+    # Schema đáp án được cache trong out_dir theo nội dung dapan.bak
+    answer_schema = restore_answer_schema(dapan_bak_path, server, user, password, data_folder,
+                                          out_dir, use_cache=use_cache)
+    
+    print("Bắt đầu chấm điểm với kiểm tra row count...")
+    results = run_batch(bak_folder, answer_schema, server, user, password, data_folder, out_dir, check_row_counts=True,
+                        restore_cache_dir=data_folder if reuse_restored else None)
+    
+    print(f"\nHoàn thành! Đã chấm {len(results)} file .bak")
+    print(f"Kết quả được lưu trong: {out_dir}")
+    print("- schema_grading_results.csv: Tổng kết điểm schema")
+    print("- row_count_summary.csv: Thống kê row count và nghiệp vụ")
+    print("- [MSSV]_pairs.csv: Chi tiết ghép bảng/cột")
+    print("- [MSSV]_fk.csv: Chi tiết khóa ngoại")
+    print("- [MSSV]_rowcount.csv: Chi tiết row count từng sinh viên")
+    return results
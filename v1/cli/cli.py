@@ -10,26 +10,22 @@ import os
 import sys
 from pathlib import Path
 
+import numpy as np
+
 # Add parent directory to path for imports
-sys.path.insert(0, str(Path(__file__).parent.parent))
+_V1_DIR = str(Path(__file__).parent.parent)
+if _V1_DIR not in sys.path:
+    sys.path.insert(0, _V1_DIR)
 
 from schema_grader import SchemaGrader
 from schema_grader.config import GradingConfig
-from schema_grader.db.build_schema import build_schema_dict
-from schema_grader.db import connection, schema_reader, restore
-from schema_grader.db.clean_data import clean_rows
+from schema_grader.db.answer_schema import load_answer_schema as _load_answer_schema
 
 
 def load_answer_schema(server: str, user: str, password: str, database: str = "00000001") -> dict:
     """Load answer schema from database."""
     try:
-        with connection.open_conn(server, user, password, database) as conn:
-            ans_struct = schema_reader.get_table_structures(conn)
-            ans_struct = clean_rows(ans_struct)
-            ans_pk = schema_reader.get_primary_keys(conn)
-            ans_fk = schema_reader.get_foreign_keys_full(conn)
-            
-        return build_schema_dict(ans_struct, ans_pk, ans_fk)
+        return _load_answer_schema(server, user, password, database)
     except Exception as e:
         print(f"Error loading answer schema: {e}")
         sys.exit(1)
@@ -82,9 +78,12 @@ def grade_batch_command(args):
     
     # Print summary
     if results:
-        scores = [r.get('schema_score', 0) for r in results if r.get('schema_score')]
-        if scores:
-            print(f"📊 Average schema score: {sum(scores)/len(scores):.2f}")
+        scores = np.fromiter((r.get('schema_score') or 0.0 for r in results),
+                             dtype=np.float64, count=len(results))
+        # Only results that actually have a schema score count towards the average
+        scores = scores[scores != 0]
+        if scores.size:
+            print(f"📊 Average schema score: {scores.mean():.2f}")
 
 
 def main():
@@ -4,6 +4,8 @@ Schema Grader Package
 Core functionality for database schema analysis and grading.
 """
 
+import os
+
 from .grading.pipeline import run_for_one_bak, run_batch
 from .grading.schema_grader import calc_schema_score
 from .matching.table_matcher import phase1
@@ -20,6 +22,7 @@ class SchemaGrader:
     
     def grade_single(self, bak_path: str, answer_schema: dict, output_dir: str) -> dict:
         """Grade a single database backup file."""
+        os.makedirs(output_dir, exist_ok=True)
         return run_for_one_bak(
             bak_path, 
             self.config.server,
@@ -32,6 +35,7 @@ class SchemaGrader:
     
     def grade_batch(self, bak_folder: str, answer_schema: dict, output_dir: str) -> list:
         """Grade multiple database backup files."""
+        os.makedirs(output_dir, exist_ok=True)
         return run_batch(
             bak_folder,
             answer_schema,
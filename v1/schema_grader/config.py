@@ -57,10 +57,8 @@ class GradingConfig:
         """Validate configuration after initialization."""
         if self.use_gemini_api and not self.gemini_api_key:
             self.gemini_api_key = API_KEY
-            
-        # Create output folder if it doesn't exist
-        os.makedirs(self.output_folder, exist_ok=True)
-        os.makedirs(self.data_folder, exist_ok=True)
+        # Folders are created by the code that writes to them (SchemaGrader,
+        # restore_database), not on every construction
     
     @classmethod
     def from_env(cls) -> 'GradingConfig':
@@ -1,20 +1,24 @@
 """
 DB Module - Chứa các hàm xử lý truy cập và thao tác cơ sở dữ liệu
 """
-from .connection import get_conn_str, open_conn
-from .schema_reader import get_table_structures, get_primary_keys, get_foreign_keys_full
+from .connection import (get_conn_str, open_conn, open_conn_pair, scoped_conn, release_conn,
+                         ConnectionCache, ConnectionPool, pool)
+from .schema_reader import get_table_structures, get_primary_keys, get_foreign_keys_full, get_all_metadata
 from .clean_data import clean_rows
 from .drop_db import drop_database
 from .restore import restore_database
 from .build_schema import build_schema_dict
 from .apply_alias import apply_alias
 from .primary_key_reader import save_primary_keys
+from .answer_schema import load_answer_schema, restore_answer_schema
 
 __all__ = [
-    'get_conn_str', 'open_conn',
-    'get_table_structures', 'get_primary_keys', 'get_foreign_keys_full',
+    'get_conn_str', 'open_conn', 'open_conn_pair', 'scoped_conn', 'release_conn',
+    'ConnectionCache', 'ConnectionPool', 'pool',
+    'get_table_structures', 'get_primary_keys', 'get_foreign_keys_full', 'get_all_metadata',
     'clean_rows', 'drop_database',
     'restore_database',
     'build_schema_dict', 'apply_alias',
-    'save_primary_keys'
+    'save_primary_keys',
+    'load_answer_schema', 'restore_answer_schema'
 ]
@@ -0,0 +1,79 @@
+"""
+Đọc schema đáp án, có cache trên đĩa theo nội dung file dapan.bak.
+"""
+import os
+import pickle
+import hashlib
+
+from .connection import scoped_conn
+from .schema_reader import get_all_metadata
+from .clean_data import clean_rows
+from .build_schema import build_schema_dict
+from .restore import restore_database, bak_fingerprint
+from ..utils.alias_maps import TABLE_ALIAS
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+ANSWER_DB = '00000001'
+
+# Tăng khi thay đổi cách đọc/dựng schema (schema_reader, clean_rows, build_schema_dict)
+# để các file cache schema đáp án cũ không còn được dùng
+_SCHEMA_CACHE_VERSION = 2
+
+# Bảng do bước chấm tạo trong database (fk_info), không thuộc schema đáp án
+_GRADER_TABLES = frozenset({'ForeignKeyInfo'})
+
+
+def _schema_cache_tag() -> str:
+    """Phiên bản cache + bảng alias: đổi một trong hai thì cache schema cũ bị bỏ qua."""
+    h = hashlib.blake2b(str(_SCHEMA_CACHE_VERSION).encode(), digest_size=8)
+    h.update(repr(sorted(TABLE_ALIAS.items())).encode('utf-8'))
+    return h.hexdigest()
+
+
+def load_answer_schema(server: str, user: str, password: str, database: str = ANSWER_DB) -> dict:
+    """Đọc và dựng schema đáp án từ database đã restore."""
+    with scoped_conn(server, user, password, database) as conn:
+        ans_struct, ans_pk, ans_fk = get_all_metadata(conn)
+    ans_struct = [item for item in ans_struct if item['original_name'] not in _GRADER_TABLES]
+    return build_schema_dict(clean_rows(ans_struct), ans_pk, ans_fk)
+
+
+def restore_answer_schema(dapan_bak: str, server: str, user: str, password: str,
+                          data_folder: str, cache_dir: str, use_cache: bool = True) -> dict:
+    """Restore dapan.bak và đọc schema đáp án, dùng lại cache nếu có.
+
+    Database đáp án (00000001) dùng chung cho mọi thư mục bài, nên việc bỏ qua restore
+    do restore_database quyết định qua marker .restore_00000001.json trong data_folder
+    (chung cho mọi thư mục bài): chỉ bỏ qua khi database trên server đúng là bản
+    restore từ file dapan.bak này. Schema đã đọc được cache trong cache_dir dưới tên
+    .answer_<hash>_<tag>.pkl; nó chỉ phụ thuộc nội dung dapan.bak và tag (phiên bản
+    cache + TABLE_ALIAS) nên dùng được mỗi khi database đáp án khớp với file đó
+    (vừa restore hoặc dùng lại).
+
+    Args:
+        use_cache: False để luôn restore và ghi đè cache
+    """
+    answer_db = restore_database(dapan_bak, server, user, password, data_folder,
+                                 cache_dir=data_folder, force=not use_cache)
+    cache_path = os.path.join(cache_dir, f".answer_{bak_fingerprint(dapan_bak)}_{_schema_cache_tag()}.pkl")
+
+    if use_cache and os.path.isfile(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                answer_schema = pickle.load(f)
+            logger.info(f"Loaded answer schema from cache {cache_path}")
+            return answer_schema
+        except Exception as e:
+            logger.warning(f"Ignoring answer schema cache {cache_path}: {e}")
+
+    answer_schema = load_answer_schema(server, user, password, answer_db)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'wb') as f:
+            pickle.dump(answer_schema, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        logger.warning(f"Could not write answer schema cache {cache_path}: {e}")
+    return answer_schema
@@ -1,5 +1,8 @@
+from functools import lru_cache
 from ..utils.alias_maps import TABLE_ALIAS
 
+# TABLE_ALIAS is a module-level constant; call apply_alias.cache_clear() if it is changed at runtime
+@lru_cache(maxsize=4096)
 def apply_alias(name: str) -> str:
     """Thay thế tên bằng alias nếu có trong từ điển TABLE_ALIAS.
     
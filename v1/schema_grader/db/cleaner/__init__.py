@@ -1,5 +1,5 @@
-from .apply_alias import apply_alias
-from .build_schema import build_schema_dict
-from .clean_data import clean_rows
+from ..apply_alias import apply_alias
+from ..build_schema import build_schema_dict
+from ..clean_data import clean_rows
 
 __all__ = ['apply_alias', 'build_schema_dict', 'clean_rows']
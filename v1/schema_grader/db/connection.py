@@ -1,4 +1,8 @@
+import os
+import threading
 import pyodbc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from ..config import *
 
 pyodbc.pooling = True
@@ -10,4 +14,147 @@ def get_conn_str(server, user, password, database="master"):
     )
 
 def open_conn(server, user, password, database="master", **kw):
-    return pyodbc.connect(get_conn_str(server, user, password, database), **kw)
+    conn = pyodbc.connect(get_conn_str(server, user, password, database), **kw)
+    # Không gửi thông báo "n rows affected" về client cho mỗi câu lệnh
+    conn.cursor().execute("SET NOCOUNT ON")
+    return conn
+
+class ConnectionCache:
+    """Dữ liệu đọc được theo từng connection: {id(conn): (conn, value)}.
+
+    pyodbc.Connection không gắn thêm thuộc tính được nên cache ở mức module, chỉ giữ
+    vài connection gần nhất (đáp án + sinh viên đang chấm). Entry giữ tham chiếu tới
+    connection, vì vậy connection dùng cache phải được trả bằng release_conn
+    (hoặc mở bằng scoped_conn / open_conn_pair) để không bị giữ mở.
+    """
+
+    def __init__(self, maxsize: int = 4):
+        self.maxsize = maxsize
+        self._entries = {}
+        _CONNECTION_CACHES.append(self)
+
+    def get(self, conn):
+        cached = self._entries.get(id(conn))
+        return cached[1] if cached is not None and cached[0] is conn else None
+
+    def put(self, conn, value) -> None:
+        self._entries.pop(id(conn), None)
+        if len(self._entries) >= self.maxsize:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[id(conn)] = (conn, value)
+
+    def invalidate(self, conn=None) -> None:
+        if conn is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(id(conn), None)
+
+
+_CONNECTION_CACHES = []
+
+def release_conn(conn) -> None:
+    """Xóa mọi dữ liệu đã cache của connection rồi đóng nó."""
+    for cache in _CONNECTION_CACHES:
+        cache.invalidate(conn)
+    conn.close()
+
+@contextmanager
+def scoped_conn(server, user, password, database="master", **kw):
+    """Như `with open_conn(...)` (commit khi thoát bình thường) nhưng luôn đóng kết nối.
+
+    `with conn:` của pyodbc chỉ commit, không đóng; kết nối vẫn mở cho tới khi bị thu
+    gom, và còn lâu hơn nếu nằm trong ConnectionCache.
+    """
+    conn = open_conn(server, user, password, database, **kw)
+    try:
+        yield conn
+        conn.commit()
+    finally:
+        release_conn(conn)
+
+@contextmanager
+def open_conn_pair(server, user, password, database_a, database_b, **kw):
+    """Mở song song hai kết nối (vd. đáp án và sinh viên) để hai lần bắt tay không nối tiếp nhau.
+
+    Cả hai kết nối luôn được đóng khi thoát khỏi khối with.
+    """
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_a = ex.submit(open_conn, server, user, password, database_a, **kw)
+        f_b = ex.submit(open_conn, server, user, password, database_b, **kw)
+        conns = []
+        try:
+            for f in (f_a, f_b):
+                conns.append(f.result())
+        except Exception:
+            # Đóng kết nối đã mở được (kể cả khi kết nối kia lỗi)
+            for f in (f_a, f_b):
+                if f.exception() is None:
+                    f.result().close()
+            raise
+    conn_a, conn_b = conns
+    try:
+        yield conn_a, conn_b
+        conn_a.commit()
+        conn_b.commit()
+    finally:
+        release_conn(conn_a)
+        release_conn(conn_b)
+
+
+class ConnectionPool:
+    """Giữ lại các kết nối đã mở để dùng lại, theo (chuỗi kết nối, autocommit).
+
+    Dùng cho các kết nối tới master (restore, drop, kiểm tra database) vốn được mở
+    vài lần cho mỗi file .bak. Không dùng cho kết nối tới database sinh viên vì
+    database đó bị xóa sau khi chấm. Kết nối lỗi trong khối with bị đóng, không trả lại pool.
+    """
+
+    def __init__(self, max_idle_per_key: int = 2):
+        self.max_idle_per_key = max_idle_per_key
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _take(self, key):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Tiến trình con (fork) không dùng chung socket với tiến trình cha
+                self._idle = {}
+                self._pid = os.getpid()
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _give_back(self, key, conn) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def acquire(self, server, user, password, database="master", autocommit=False):
+        key = (get_conn_str(server, user, password, database), autocommit)
+        conn = self._take(key) or open_conn(server, user, password, database, autocommit=autocommit)
+        try:
+            yield conn
+            if not autocommit:
+                conn.commit()
+        except BaseException:
+            conn.close()
+            raise
+        self._give_back(key, conn)
+
+    def close_all(self) -> None:
+        """Đóng mọi kết nối đang rảnh (gọi trước khi tạo tiến trình con)."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                try:
+                    conn.close()
+                except pyodbc.Error:
+                    pass
+
+
+pool = ConnectionPool()
@@ -1,4 +1,4 @@
-from ..db.connection import open_conn
+from ..db.connection import pool
 
 def drop_database(server, user, pw, db_name):
     """Helper để xóa database sau khi dùng xong.
@@ -12,11 +12,14 @@ def drop_database(server, user, pw, db_name):
     if not db_name or db_name == '00000001':  # không xóa DB đáp án
         return
     try:
+        # ROLLBACK IMMEDIATE ngắt mọi phiên đang mở tới database (kể cả kết nối
+        # đang nằm trong pool của ODBC driver manager) nên DROP không phải chờ
         drop_sql = f"""
-            ALTER DATABASE [{db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;
-            DROP DATABASE [{db_name}];
-        """
-        with open_conn(server, user, pw, autocommit=True) as conn:
+            IF DB_ID('{db_name}') IS NOT NULL BEGIN
+                ALTER DATABASE [{db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;
+                DROP DATABASE [{db_name}];
+            END"""
+        with pool.acquire(server, user, pw, autocommit=True) as conn:
             conn.execute(drop_sql)
     except Exception as e:
         print(f"Không thể xóa database {db_name}: {e}")
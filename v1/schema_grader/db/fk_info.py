@@ -1,5 +1,7 @@
 """Module xử lý tạo và lưu thông tin khóa ngoại vào bảng ForeignKeyInfo."""
 
+import pyodbc
+
 def create_fk_info_table(conn):
     """Tạo bảng ForeignKeyInfo nếu chưa tồn tại."""
     try:
@@ -21,12 +23,24 @@ def create_fk_info_table(conn):
         print(f"Error creating ForeignKeyInfo table: {e}")
         return False
 
-def check_string_agg_support(conn):
-    """Check if STRING_AGG function is supported"""
+def drop_fk_info_table(conn):
+    """Xóa bảng ForeignKeyInfo (dùng khi giữ lại database đã restore để chấm lại)."""
     try:
-        conn.execute("SELECT STRING_AGG('test', ',')")
+        conn.execute("IF OBJECT_ID('ForeignKeyInfo', 'U') IS NOT NULL DROP TABLE ForeignKeyInfo")
+        conn.commit()
         return True
-    except:
+    except Exception as e:
+        print(f"Error dropping ForeignKeyInfo table: {e}")
+        return False
+
+def check_string_agg_support(conn):
+    """Check if STRING_AGG function is supported (SQL Server 2017 / version 14 trở lên).
+
+    Phiên bản server do driver trả về lúc đăng nhập nên không cần truy vấn thử.
+    """
+    try:
+        return int(conn.getinfo(pyodbc.SQL_DBMS_VER).split('.')[0]) >= 14
+    except (pyodbc.Error, ValueError, AttributeError):
         return False
 
 def save_foreign_keys(conn):
@@ -35,12 +49,10 @@ def save_foreign_keys(conn):
         return False
         
     try:
-        # Xóa dữ liệu cũ
-        conn.execute("DELETE FROM ForeignKeyInfo")
-        
         # Use STRING_AGG if supported, otherwise use XML PATH as fallback
         if check_string_agg_support(conn):
             sql = """
+            DELETE FROM ForeignKeyInfo;
             WITH FKInfo AS (
                 SELECT 
                     fk.name AS FKName,
@@ -62,6 +74,7 @@ def save_foreign_keys(conn):
             """
         else:
             sql = """
+            DELETE FROM ForeignKeyInfo;
             WITH FKInfo AS (
                 SELECT 
                     fk.name AS FKName,
@@ -100,6 +113,8 @@ def save_foreign_keys(conn):
         FROM FKInfo
         """
         
+        # Xóa dữ liệu cũ và insert trong cùng một batch; kết nối không autocommit
+        # nên cả hai nằm trong một transaction, commit một lần
         conn.execute(sql)
         conn.commit()
         return True
@@ -110,7 +125,5 @@ def save_foreign_keys(conn):
 
 def initialize_database(conn):
     """Khởi tạo cơ sở dữ liệu với các bảng cần thiết."""
-    success = create_fk_info_table(conn)
-    if success:
-        success = save_foreign_keys(conn)
-    return success
+    # save_foreign_keys tự tạo bảng ForeignKeyInfo nếu chưa có
+    return save_foreign_keys(conn)
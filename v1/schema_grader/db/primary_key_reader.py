@@ -1,6 +1,5 @@
 """Module xử lý việc đọc và lưu thông tin khóa chính từ database."""
 
-from ..utils.constants import STAGE_RE
 from .connection import open_conn
 
 def get_primary_keys(conn, mssv: str = None):
@@ -24,17 +23,12 @@ def get_primary_keys(conn, mssv: str = None):
             ON TC.CONSTRAINT_NAME = KU.CONSTRAINT_NAME
         WHERE TC.CONSTRAINT_TYPE = 'PRIMARY KEY'
             AND LEFT(KU.TABLE_NAME, 3) <> 'sys'
+            AND LOWER(KU.TABLE_NAME) NOT LIKE 'stage%'
         ORDER BY KU.TABLE_NAME, KU.ORDINAL_POSITION"""
     
+    # Các bảng stage đã được loại trong SQL
     cursor = conn.cursor()
-    rows = cursor.execute(sql).fetchall()
-    
-    # Lọc bỏ các bảng stage nếu có
-    return [
-        (pk, tbl, col, pos) 
-        for pk, tbl, col, pos in rows
-        if not (STAGE_RE.match(tbl) or tbl.lower().startswith('stage'))
-    ]
+    return [tuple(row) for row in cursor.execute(sql).fetchall()]
 
 def save_primary_keys(grading_conn, source_conn, mssv: str):
     """Lưu thông tin khóa chính vào database grading.
@@ -47,25 +41,20 @@ def save_primary_keys(grading_conn, source_conn, mssv: str):
     # Lấy thông tin khóa chính từ database nguồn
     pk_data = get_primary_keys(source_conn)
     
-    # Lấy mapping TableID và ColumnID từ database grading
+    # Lấy mapping TableID và ColumnID từ database grading trong một truy vấn
     cursor = grading_conn.cursor()
-    
-    # Lấy mapping table_name -> table_id
-    cursor.execute("""
-        SELECT TableName, TableID 
-        FROM TableInfo 
-        WHERE MSSV = ?
-    """, mssv)
-    table_ids = {name: id for name, id in cursor.fetchall()}
-    
-    # Lấy mapping (table_id, column_name) -> column_id
     cursor.execute("""
-        SELECT c.TableID, c.ColumnName, c.ColumnID
-        FROM ColumnInfo c
-        JOIN TableInfo t ON c.TableID = t.TableID AND c.MSSV = t.MSSV
-        WHERE c.MSSV = ?
+        SELECT t.TableName, t.TableID, c.ColumnName, c.ColumnID
+        FROM TableInfo t
+        LEFT JOIN ColumnInfo c ON c.TableID = t.TableID AND c.MSSV = t.MSSV
+        WHERE t.MSSV = ?
     """, mssv)
-    column_ids = {(tid, col): cid for tid, col, cid in cursor.fetchall()}
+    table_ids = {}   # table_name -> table_id
+    column_ids = {}  # (table_id, column_name) -> column_id
+    for table_name, table_id, column_name, column_id in cursor.fetchall():
+        table_ids[table_name] = table_id
+        if column_id is not None:
+            column_ids[(table_id, column_name)] = column_id
     
     # Chuẩn bị dữ liệu để insert
     values = []
@@ -87,6 +76,7 @@ def save_primary_keys(grading_conn, source_conn, mssv: str):
         return
         
     # Insert vào PrimaryKeyInfo
+    cursor.fast_executemany = True
     cursor.executemany("""
         INSERT INTO PrimaryKeyInfo (
             TableID, ColumnID, PKName, TableName, ColumnName, 
@@ -1,11 +1,14 @@
-import os, re, pyodbc
-from .connection import open_conn
-
-def get_logical_file_names(bak_file, server, user, pw):
-    with open_conn(server, user, pw, autocommit=True) as conn:
-        rows = conn.cursor().execute(
-            f"RESTORE FILELISTONLY FROM DISK = N'{bak_file}'"
-        ).fetchall()
+import os, re, json, hashlib, pyodbc
+from .connection import pool
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
+
+# Số byte đọc ở đầu và cuối file .bak để tạo fingerprint
+_FINGERPRINT_CHUNK = 1 << 20
+
+def _logical_file_names(cursor, bak_file):
+    rows = cursor.execute(f"RESTORE FILELISTONLY FROM DISK = N'{bak_file}'").fetchall()
     if len(rows) < 2:
         raise ValueError("Backup thiếu logical file name")
     return rows[0][0], rows[1][0]
@@ -14,40 +17,98 @@ def normalize_path_for_sql(path):
     """Chuẩn hóa đường dẫn cho SQL Server: dùng backslash, escape đúng cách"""
     return os.path.abspath(path).replace('/', '\\')
 
-def restore_database(bak_file, server, user, pw, data_folder) -> str:
+def db_name_for_bak(bak_file) -> str:
+    """Tên database sẽ restore cho file .bak (MSSV 8 số, hoặc 00000001 cho dapan.bak)."""
     bak_name = os.path.basename(bak_file)
-    db_name  = '00000001' if bak_name.lower() == 'dapan.bak' \
-               else re.search(r'(\d{8})', bak_name).group(1) \
-                    if re.search(r'(\d{8})', bak_name) else os.path.splitext(bak_name)[0]
+    return '00000001' if bak_name.lower() == 'dapan.bak' \
+           else re.search(r'(\d{8})', bak_name).group(1) \
+                if re.search(r'(\d{8})', bak_name) else os.path.splitext(bak_name)[0]
+
+def bak_fingerprint(bak_path: str) -> str:
+    """Fingerprint của file .bak: kích thước file + 1 MiB đầu + 1 MiB cuối."""
+    size = os.path.getsize(bak_path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(bak_path, 'rb') as f:
+        h.update(f.read(_FINGERPRINT_CHUNK))
+        if size > _FINGERPRINT_CHUNK:
+            f.seek(max(size - _FINGERPRINT_CHUNK, _FINGERPRINT_CHUNK))
+            h.update(f.read())
+    return h.hexdigest()
+
+def _database_create_date(server, user, pw, db_name):
+    """create_date của database (đổi mỗi lần restore), None nếu database không tồn tại."""
+    with pool.acquire(server, user, pw, autocommit=True) as conn:
+        created = conn.cursor().execute(
+            "SELECT create_date FROM sys.databases WHERE name = ?", db_name).fetchval()
+    return None if created is None else created.isoformat()
+
+def _restore_marker_path(cache_dir, db_name):
+    return os.path.join(cache_dir, f".restore_{db_name}.json")
+
+def _read_restore_marker(marker_path):
+    try:
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+        return marker if isinstance(marker, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+def restore_database(bak_file, server, user, pw, data_folder, cache_dir=None, force=False) -> str:
+    """Restore file .bak thành database (tên theo db_name_for_bak).
+
+    cache_dir: nếu có, ghi fingerprint của file .bak đã restore cùng create_date của
+               database vào cache_dir/.restore_<db_name>.json (mỗi database một file nên
+               các worker song song không ghi đè nhau) và bỏ qua restore khi file .bak
+               không đổi và database trên server vẫn là bản đã restore đó (create_date
+               khớp, tức là chưa bị restore lại từ file khác).
+    force: luôn restore, kể cả khi marker khớp (marker vẫn được ghi lại)
+    """
+    db_name = db_name_for_bak(bak_file)
+
+    marker_path = fingerprint = None
+    if cache_dir:
+        marker_path = _restore_marker_path(cache_dir, db_name)
+        fingerprint = bak_fingerprint(bak_file)
+        marker = _read_restore_marker(marker_path)
+        if (not force and marker.get('fingerprint') == fingerprint
+                and marker.get('create_date') is not None
+                and marker.get('create_date') == _database_create_date(server, user, pw, db_name)):
+            logger.info(f"Reusing restored database {db_name} for {bak_file}")
+            return db_name
 
-    mdf_logical, ldf_logical = get_logical_file_names(bak_file, server, user, pw)
-    
     # Đảm bảo đường dẫn đúng chuẩn Windows cho SQL Server
-    bak_file = normalize_path_for_sql(bak_file)
+    bak_sql = normalize_path_for_sql(bak_file)
     mdf_path = normalize_path_for_sql(os.path.join(data_folder, f"{db_name}.mdf"))
     ldf_path = normalize_path_for_sql(os.path.join(data_folder, f"{db_name}_log.ldf"))
     
-    drop_sql = f"""
-        IF DB_ID('{db_name}') IS NOT NULL BEGIN
-            ALTER DATABASE [{db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;
-            DROP DATABASE [{db_name}];
-        END"""
-    restore_sql = f"""
-        RESTORE DATABASE [{db_name}] 
-        FROM DISK = N'{bak_file}'
-        WITH FILE = 1, 
-             REPLACE,
-             MOVE '{mdf_logical}' TO N'{mdf_path}',
-             MOVE '{ldf_logical}' TO N'{ldf_path}',
-             STATS = 10, 
-             RECOVERY"""
-    
     # Đảm bảo thư mục tồn tại
     os.makedirs(os.path.dirname(mdf_path), exist_ok=True)
     
-    with open_conn(server, user, pw, autocommit=True) as conn:
-        conn.execute(drop_sql)
+    # FILELISTONLY và DROP + RESTORE dùng chung một kết nối; DROP và RESTORE gửi trong một batch
+    with pool.acquire(server, user, pw, autocommit=True) as conn:
         cur = conn.cursor()
-        cur.execute(restore_sql)
+        mdf_logical, ldf_logical = _logical_file_names(cur, bak_file)
+        cur.execute(f"""
+            IF DB_ID('{db_name}') IS NOT NULL BEGIN
+                ALTER DATABASE [{db_name}] SET SINGLE_USER WITH ROLLBACK IMMEDIATE;
+                DROP DATABASE [{db_name}];
+            END;
+            RESTORE DATABASE [{db_name}] 
+            FROM DISK = N'{bak_sql}'
+            WITH FILE = 1, 
+                 REPLACE,
+                 MOVE '{mdf_logical}' TO N'{mdf_path}',
+                 MOVE '{ldf_logical}' TO N'{ldf_path}',
+                 STATS = 10, 
+                 RECOVERY""")
         while cur.nextset(): pass
+
+    if marker_path:
+        try:
+            create_date = _database_create_date(server, user, pw, db_name)
+            with open(marker_path, 'w', encoding='utf-8') as f:
+                json.dump({'bak_file': bak_sql, 'fingerprint': fingerprint,
+                           'create_date': create_date}, f)
+        except OSError as e:
+            logger.warning(f"Could not write restore cache {marker_path}: {e}")
     return db_name
@@ -1,57 +1,48 @@
 import re
-from .connection import open_conn
+import logging
+from functools import lru_cache
+from .connection import open_conn, ConnectionCache
+from .fk_info import check_string_agg_support
 from ..config import STAGE_RE
+from ..utils.log import get_logger
 
+logger = get_logger(__name__)
+
+# Numeric prefixes like "08." or "07. " (with optional space after dot)
+_NUM_PREFIX_RE = re.compile(r'^\d+\.\s*')
+# Common Vietnamese/English table prefixes (case-insensitive, with optional space/underscore)
+_TABLE_PREFIX_RE = re.compile(r'^(c|dm|tbl|bang|t|b)[ _]*', re.IGNORECASE)
+
+# Each table name is cleaned once per column row, so cache the result
+@lru_cache(maxsize=4096)
 def _clean_table_name(name: str) -> str:
-    # Remove numeric prefixes like "08." or "07. " (with optional space after dot)
-    cleaned = re.sub(r'^\d+\.\s*', '', name)
-    # Remove common Vietnamese/English table prefixes (case-insensitive, with optional space/underscore)
-    cleaned = re.sub(r'^(c|dm|tbl|bang|t|b)[ _]*', '', cleaned, flags=re.IGNORECASE)
+    cleaned = _NUM_PREFIX_RE.sub('', name) if name[:1].isdigit() else name
+    cleaned = _TABLE_PREFIX_RE.sub('', cleaned)
     # Convert to uppercase for consistency
     return cleaned.upper()
 
-def get_table_structures(conn):
-    sql = """
+# Bảng stage (tên chứa 'stage', như STAGE_RE trong clean_rows) bị loại ngay trong SQL;
+# LOWER để không phụ thuộc collation của database sinh viên
+_STRUCTURE_SQL = """
         SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE
         FROM INFORMATION_SCHEMA.COLUMNS
         WHERE LEFT(TABLE_NAME, 3) <> 'sys'
+          AND LOWER(TABLE_NAME) NOT LIKE '%stage%'
           AND TABLE_NAME IN (
             SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES
             WHERE TABLE_TYPE='BASE TABLE' AND LEFT(TABLE_NAME,3) <> 'sys')
         ORDER BY TABLE_NAME, ORDINAL_POSITION"""
-    rows = conn.cursor().execute(sql).fetchall()
-    
-    table_data = []
-    # Debug: Print raw table names from database
-    raw_table_names = set()
-    
-    for original_t, c, d in rows:
-        raw_table_names.add(original_t)
-        cleaned_t = _clean_table_name(original_t)
-        table_data.append({'original_name': original_t, 'cleaned_name': cleaned_t, 'column_name': c, 'data_type': d})
-    
-    print(f"Debug: Raw table names from DB: {sorted(raw_table_names)}")
-    print(f"Debug: Sample cleaning - '08.CT_ChiTien' -> '{_clean_table_name('08.CT_ChiTien')}'")
-    print(f"Debug: Sample cleaning - '07.ChiTien' -> '{_clean_table_name('07.ChiTien')}'")
-    print(f"Debug: Sample cleaning - '07. CHITIEN' -> '{_clean_table_name('07. CHITIEN')}'")
-    
-    return table_data
 
-def get_primary_keys(conn):
-    sql = """
+_PRIMARY_KEY_SQL = """
         SELECT KU.TABLE_NAME, KU.COLUMN_NAME
         FROM INFORMATION_SCHEMA.TABLE_CONSTRAINTS AS TC
         JOIN INFORMATION_SCHEMA.KEY_COLUMN_USAGE AS KU
             ON TC.CONSTRAINT_TYPE='PRIMARY KEY' AND TC.CONSTRAINT_NAME = KU.CONSTRAINT_NAME
         WHERE LEFT(KU.TABLE_NAME,3) <> 'sys'
+          AND LOWER(KU.TABLE_NAME) NOT LIKE '%stage%'
         ORDER BY KU.TABLE_NAME, KU.ORDINAL_POSITION"""
-    pk = {}
-    for tbl_original_name, col in conn.cursor().execute(sql):
-        pk.setdefault(tbl_original_name, []).append(col)
-    return pk
 
-def get_foreign_keys_full(conn):
-    sql = """
+_FOREIGN_KEY_SQL = """
         SELECT fk.name, tp.name, cp.name, ref.name, cr.name
         FROM sys.foreign_keys fk
         JOIN sys.tables tp    ON fk.parent_object_id     = tp.object_id
@@ -63,8 +54,51 @@ def get_foreign_keys_full(conn):
         JOIN sys.columns cr   ON fkc.referenced_object_id = cr.object_id
                              AND fkc.referenced_column_id = cr.column_id
         WHERE LEFT(tp.name,3)<>'sys' AND LEFT(ref.name,3)<>'sys'
+          AND LOWER(tp.name) NOT LIKE '%stage%'
         ORDER BY fk.name"""
-    rows, out = conn.cursor().execute(sql).fetchall(), {}
+
+# SQL Server 2017+: mỗi khóa ngoại một dòng, danh sách cột đã gom bằng STRING_AGG
+_FOREIGN_KEY_AGG_SQL = """
+        SELECT fk.name, tp.name, ref.name,
+               STRING_AGG(cp.name, ',') WITHIN GROUP (ORDER BY fkc.constraint_column_id),
+               STRING_AGG(cr.name, ',') WITHIN GROUP (ORDER BY fkc.constraint_column_id)
+        FROM sys.foreign_keys fk
+        JOIN sys.tables tp    ON fk.parent_object_id     = tp.object_id
+        JOIN sys.tables ref   ON fk.referenced_object_id = ref.object_id
+        JOIN sys.foreign_key_columns fkc
+             ON fk.object_id = fkc.constraint_object_id
+        JOIN sys.columns cp   ON fkc.parent_object_id = cp.object_id
+                             AND fkc.parent_column_id = cp.column_id
+        JOIN sys.columns cr   ON fkc.referenced_object_id = cr.object_id
+                             AND fkc.referenced_column_id = cr.column_id
+        WHERE LEFT(tp.name,3)<>'sys' AND LEFT(ref.name,3)<>'sys'
+          AND LOWER(tp.name) NOT LIKE '%stage%'
+        GROUP BY fk.name, tp.name, ref.name
+        ORDER BY fk.name"""
+
+def _parse_table_structures(rows):
+    table_data = [
+        {'original_name': original_t, 'cleaned_name': _clean_table_name(original_t),
+         'column_name': c, 'data_type': d}
+        for original_t, c, d in rows
+    ]
+    
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Raw table names from DB: %s", sorted({item['original_name'] for item in table_data}))
+        for sample in ('08.CT_ChiTien', '07.ChiTien', '07. CHITIEN'):
+            logger.debug("Sample cleaning - '%s' -> '%s'", sample, _clean_table_name(sample))
+    
+    return table_data
+
+def _parse_primary_keys(rows):
+    # Khóa theo tên bảng gốc; build_schema_dict chỉ gắn PK vào bảng có đúng tên gốc đó
+    pk = {}
+    for tbl_original_name, col in rows:
+        pk.setdefault(tbl_original_name, []).append(col)
+    return pk
+
+def _parse_foreign_keys(rows):
+    out = {}
     for fk_name, p_tbl_original, fk_col, r_tbl_original, pk_col in rows:
         key = (fk_name, p_tbl_original, r_tbl_original)
 
@@ -77,3 +111,71 @@ def get_foreign_keys_full(conn):
         out[key]['parent_cols'].append(fk_col)
         out[key]['ref_cols'].append(pk_col)
     return list(out.values())
+
+def _parse_aggregated_foreign_keys(rows):
+    return [
+        {
+            'parent_tbl': p_tbl_original,
+            'parent_cols': fk_cols.split(','),
+            'ref_tbl': r_tbl_original,
+            'ref_cols': pk_cols.split(','),
+        }
+        for fk_name, p_tbl_original, r_tbl_original, fk_cols, pk_cols in rows
+    ]
+
+# Số dòng mỗi lần fetchmany khi đọc INFORMATION_SCHEMA.COLUMNS (có thể hàng nghìn dòng)
+_FETCH_SIZE = 2048
+
+def _fetch_rows(cursor):
+    """Đọc hết result set hiện tại theo từng khối _FETCH_SIZE dòng."""
+    cursor.arraysize = _FETCH_SIZE
+    return [row for rows in iter(cursor.fetchmany, []) for row in rows]
+
+# Metadata đã đọc theo connection: (structures, pks, fks)
+_METADATA_CACHE = ConnectionCache()
+
+def get_table_structures(conn):
+    return get_all_metadata(conn)[0]
+
+def get_primary_keys(conn):
+    return get_all_metadata(conn)[1]
+
+def get_foreign_keys_full(conn):
+    return get_all_metadata(conn)[2]
+
+def invalidate_metadata_cache(conn=None) -> None:
+    """Xóa metadata đã cache của một connection (hoặc tất cả), dùng khi có DDL."""
+    _METADATA_CACHE.invalidate(conn)
+
+def get_all_metadata(conn):
+    """Đọc cấu trúc bảng, khóa chính và khóa ngoại trong một lần gửi (3 result set).
+
+    Kết quả được cache theo connection nên get_table_structures, get_primary_keys
+    và get_foreign_keys_full trên cùng connection không truy vấn lại catalog.
+
+    Returns:
+        (table_structures, primary_keys, foreign_keys) giống như khi gọi
+        get_table_structures, get_primary_keys và get_foreign_keys_full.
+    """
+    cached = _METADATA_CACHE.get(conn)
+    if cached is not None:
+        return cached
+
+    if check_string_agg_support(conn):
+        fk_sql, parse_fks = _FOREIGN_KEY_AGG_SQL, _parse_aggregated_foreign_keys
+    else:
+        fk_sql, parse_fks = _FOREIGN_KEY_SQL, _parse_foreign_keys
+
+    cursor = conn.cursor()
+    cursor.execute(";\n".join((_STRUCTURE_SQL, _PRIMARY_KEY_SQL, fk_sql)))
+    structure_rows = _fetch_rows(cursor)
+    cursor.nextset()
+    pk_rows = cursor.fetchall()
+    cursor.nextset()
+    fk_rows = cursor.fetchall()
+    metadata = (_parse_table_structures(structure_rows),
+                _parse_primary_keys(pk_rows),
+                parse_fks(fk_rows))
+
+    _METADATA_CACHE.put(conn, metadata)
+    return metadata
@@ -6,6 +6,7 @@ import os
 import hashlib
 import pickle
 import warnings
+from contextlib import contextmanager
 from functools import lru_cache
 from typing import Optional
 
@@ -54,12 +55,133 @@ def _initialize_api() -> bool:
 # Run initialization
 _initialize_api()
 
-# Load or create cache
-try:
-    with open(EMBED_CACHE_FILE, 'rb') as f:
-        _CACHE = pickle.load(f)
-except Exception:
-    _CACHE = {}
+# On-disk embedding cache, append-only, in two files with one row per cached text:
+#   <base>.keys  64-byte sha256 hex keys, read at start-up to build the index
+#   <base>.vec   16-byte header b"EMB2" + uint32 dim, then float32[dim] rows,
+#                opened with np.memmap so only the vectors actually used are read.
+# Appends from parallel grading workers are serialized with a lock on <base>.lock.
+# Only Gemini vectors are persisted; the hash fallback is cheap to recompute.
+_CACHE_BASE = os.path.splitext(EMBED_CACHE_FILE)[0]
+_KEYS_FILE = _CACHE_BASE + '.keys'
+_VEC_FILE = _CACHE_BASE + '.vec'
+_LOCK_FILE = _CACHE_BASE + '.lock'
+_CACHE_MAGIC = b'EMB2'
+_CACHE_HEADER = 16
+_KEY_SIZE = 64
+_FALLBACK_DIM = 384
+
+_CACHE_INDEX: dict = {}          # key (bytes) -> row in _CACHE_VECTORS
+_CACHE_VECTORS = None            # np.memmap of the vectors stored before this run
+
+
+@contextmanager
+def _cache_lock():
+    """Exclusive inter-process lock for appending to the cache files."""
+    with open(_LOCK_FILE, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10 s; keep waiting
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_cache_dim() -> Optional[int]:
+    try:
+        with open(_VEC_FILE, 'rb') as f:
+            header = f.read(_CACHE_HEADER)
+    except OSError:
+        return None
+    if len(header) < _CACHE_HEADER or header[:4] != _CACHE_MAGIC:
+        return None
+    return int.from_bytes(header[4:8], 'little') or None
+
+
+def _cache_rows(dim: int) -> int:
+    """Complete rows present in both files (a partially written last row is ignored)."""
+    try:
+        keys_rows = os.path.getsize(_KEYS_FILE) // _KEY_SIZE
+        vec_rows = (os.path.getsize(_VEC_FILE) - _CACHE_HEADER) // (4 * dim)
+    except OSError:
+        return 0
+    return max(min(keys_rows, vec_rows), 0)
+
+
+def _open_cache() -> bool:
+    """Index the stored keys and memory-map the vectors. False if there is no cache yet."""
+    global _CACHE_VECTORS
+    dim = _read_cache_dim()
+    if dim is None:
+        return False
+    rows = _cache_rows(dim)
+    if rows > 0:
+        keys = np.fromfile(_KEYS_FILE, dtype=f'S{_KEY_SIZE}', count=rows)
+        _CACHE_VECTORS = np.memmap(_VEC_FILE, dtype='<f4', mode='r',
+                                   offset=_CACHE_HEADER, shape=(rows, dim))
+        _CACHE_INDEX.clear()
+        _CACHE_INDEX.update(zip(keys.tolist(), range(rows)))
+    return True
+
+
+def _append_to_cache(items) -> None:
+    """Append (key, vector) pairs to the on-disk cache (no rewrite of existing rows)."""
+    items = list(items)
+    if not items:
+        return
+    with _cache_lock():
+        dim = _read_cache_dim()
+        if dim is None:
+            dim = items[0][1].size
+            with open(_VEC_FILE, 'wb') as f:
+                f.write(_CACHE_MAGIC + dim.to_bytes(4, 'little') + bytes(_CACHE_HEADER - 8))
+            open(_KEYS_FILE, 'wb').close()
+        items = [(key, vec) for key, vec in items if vec.size == dim]
+        if not items:
+            return
+        # Drop a partial row left by an interrupted append so both files stay aligned
+        rows = _cache_rows(dim)
+        for path, size in ((_KEYS_FILE, rows * _KEY_SIZE),
+                           (_VEC_FILE, _CACHE_HEADER + rows * 4 * dim)):
+            if os.path.getsize(path) != size:
+                os.truncate(path, size)
+        with open(_KEYS_FILE, 'ab') as f:
+            f.write(b''.join(key.encode('ascii') for key, _ in items))
+        with open(_VEC_FILE, 'ab') as f:
+            f.write(np.stack([vec for _, vec in items]).astype('<f4').tobytes())
+
+
+def _import_legacy_cache() -> None:
+    """One-time import of Gemini vectors from the old pickled {key: vector} cache."""
+    try:
+        with open(EMBED_CACHE_FILE, 'rb') as f:
+            legacy = pickle.load(f)
+    except Exception:
+        return
+    try:
+        vectors = ((key, np.asarray(vec, dtype=np.float32).ravel()) for key, vec in legacy.items())
+        _append_to_cache((key, vec) for key, vec in vectors if vec.size != _FALLBACK_DIM)
+    except (OSError, AttributeError, ValueError):
+        return
+    _open_cache()
+
+
+if not _open_cache():
+    _import_legacy_cache()
 
 
 def _get_domain_context(text: str) -> str:
@@ -95,8 +217,9 @@ def _fallback_embed(text: str) -> np.ndarray:
 def embed(text: str) -> np.ndarray:
     """Embed text via Gemini API or fallback, with caching."""
     key = hashlib.sha256(text.encode()).hexdigest()
-    if key in _CACHE:
-        return _CACHE[key]
+    row = _CACHE_INDEX.get(key.encode('ascii'))
+    if row is not None:
+        return np.array(_CACHE_VECTORS[row])
 
     if _API_AVAILABLE and _GENAI:
         content = _get_domain_context(text)
@@ -106,14 +229,13 @@ def embed(text: str) -> np.ndarray:
             vec /= (np.linalg.norm(vec) + 1e-8)
         except Exception as e:
             warnings.warn(f"Embedding error: {e}; using fallback.")
-            vec = _fallback_embed(text)
+            return _fallback_embed(text)
     else:
-        vec = _fallback_embed(text)
+        return _fallback_embed(text)
 
-    _CACHE[key] = vec
+    # Vectors computed in this run are served by lru_cache; the file is for later runs
     try:
-        with open(EMBED_CACHE_FILE, 'wb') as f:
-            pickle.dump(_CACHE, f)
+        _append_to_cache([(key, vec)])
     except Exception:
         pass
     return vec
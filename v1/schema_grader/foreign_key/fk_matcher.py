@@ -2,7 +2,7 @@
 
 import pandas as pd
 import os
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 from ..utils.normalizer import canonical
 from ..embedding.gemini import embed
 
@@ -54,7 +54,7 @@ def get_foreign_keys_from_info(conn) -> List[Dict]:
         return []
 
 def compare_foreign_keys(ans_conn, stu_conn, table_mapping: Dict[str, str], 
-                        output_file: str) -> Tuple[List[Dict], float]:
+                        output_file: str, ans_fks: Optional[List[Dict]] = None) -> Tuple[List[Dict], float]:
     """So sánh khóa ngoại giữa schema đáp án và sinh viên.
     
     Args:
@@ -62,13 +62,15 @@ def compare_foreign_keys(ans_conn, stu_conn, table_mapping: Dict[str, str],
         stu_conn: Connection đến database sinh viên  
         table_mapping: Dict map từ bảng đáp án sang bảng sinh viên (kết quả stage 1)
         output_file: Đường dẫn file CSV đầu ra
+        ans_fks: Khóa ngoại đáp án đã đọc sẵn (get_foreign_keys_from_info); None để đọc từ ans_conn
     
     Returns:
         Tuple[List[Dict], float]: (Danh sách kết quả chi tiết, Tỷ lệ match)
     """
     try:
         # Lấy khóa ngoại từ cả hai schema
-        ans_fks = get_foreign_keys_from_info(ans_conn)
+        if ans_fks is None:
+            ans_fks = get_foreign_keys_from_info(ans_conn)
         if not ans_fks:
             print("Warning: No foreign keys found in answer database")
             return [], 0.0
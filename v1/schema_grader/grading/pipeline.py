@@ -1,37 +1,62 @@
 import os
 import pandas as pd
 import traceback
+from concurrent.futures import ProcessPoolExecutor
 from ..db import restore, connection, schema_reader
 from ..db.clean_data import clean_rows
 from ..db.build_schema import build_schema_dict
 from ..db.drop_db import drop_database
-from ..db.fk_info import initialize_database
+from ..db.fk_info import initialize_database, drop_fk_info_table
 from ..matching.table_matcher import phase1
 from ..matching.column_matcher import phase2_one
-from ..foreign_key.fk_matcher import compare_foreign_keys
+from ..foreign_key.fk_matcher import compare_foreign_keys, get_foreign_keys_from_info
 from .schema_grader import calc_schema_score
 from .reporter import save_schema_results_csv, save_row_count_summary
-from .row_count_checker import check_mapped_table_row_counts, format_row_count_results
+from .row_count_checker import (check_mapped_table_row_counts, format_row_count_dataframe,
+                                get_all_row_counts_fast, seed_row_count_cache)
 from .view_matcher import match_views, save_view_matches_to_csv, get_views_info
 
+# Dữ liệu đọc từ DB đáp án (khóa ngoại, view, số dòng), không đổi trong một lần chấm
+# hàng loạt nên chỉ đọc một lần cho mỗi tiến trình thay vì một lần cho mỗi bài
+_ANSWER_DB_CACHE = {}
+
+def _answer_db_read(key, read):
+    if key not in _ANSWER_DB_CACHE:
+        _ANSWER_DB_CACHE[key] = read()
+    return _ANSWER_DB_CACHE[key]
+
 
 def run_for_one_bak(bak_path, server, user, pw, data_folder,
-                    answer_schema, out_dir, check_row_counts=True) -> dict:
-    """Chấm một file .bak"""
+                    answer_schema, out_dir, check_row_counts=True,
+                    answer_fk_ready=None, restore_cache_dir=None) -> dict:
+    """Chấm một file .bak
+
+    answer_fk_ready: None để khởi tạo ForeignKeyInfo của DB đáp án trong lần chấm này;
+                     True/False nếu nơi gọi đã khởi tạo sẵn (chấm song song).
+    restore_cache_dir: nếu có, database sinh viên được giữ lại sau khi chấm và lần
+                       chấm sau bỏ qua restore khi file .bak không đổi
+                       (xem restore.restore_database).
+    """
     db_name = None
+    fk_table_created = False
+    answer_fk_initialized = False
+    if answer_fk_ready is None:
+        # Chấm lẻ: ForeignKeyInfo đáp án được dựng lại trong lần chấm này, đọc lại từ đầu
+        _ANSWER_DB_CACHE.clear()
     try:
-        db_name = restore.restore_database(bak_path, server, user, pw, data_folder)
+        db_name = restore.restore_database(bak_path, server, user, pw, data_folder,
+                                           cache_dir=restore_cache_dir)
         if db_name == '00000001':
             return {}
             
         # Đọc schema sinh viên
-        with connection.open_conn(server, user, pw, database=db_name) as conn:
-            stu_struct = schema_reader.get_table_structures(conn)
+        with connection.scoped_conn(server, user, pw, database=db_name) as conn:
+            stu_struct, stu_pk, stu_fk = schema_reader.get_all_metadata(conn)
+            fk_table_existed = any(item['original_name'] == 'ForeignKeyInfo' for item in stu_struct)
             stu_struct = clean_rows(stu_struct)
-            stu_pk = schema_reader.get_primary_keys(conn)
-            stu_fk = schema_reader.get_foreign_keys_full(conn)
             # Khởi tạo bảng ForeignKeyInfo (bỏ qua nếu lỗi)
             fk_initialized = initialize_database(conn)
+            fk_table_created = fk_initialized and not fk_table_existed
         
         student_schema = build_schema_dict(stu_struct, stu_pk, stu_fk)
         
@@ -45,27 +70,32 @@ def run_for_one_bak(bak_path, server, user, pw, data_folder,
             if stu_cleaned:
                 all_rows.extend(phase2_one(ans_tbl, stu_cleaned, answer_schema, student_schema))
         
-        # Lưu kết quả chi tiết
-        if all_rows:
-            os.makedirs(out_dir, exist_ok=True)
-            csv_path = os.path.join(out_dir, f"{db_name}_pairs.csv")
-            pd.DataFrame(all_rows, columns=[
-                'AnsTbl','AnsCol','AnsType','StuTbl','StuCol','StuType','Cos','Match'
-            ]).to_csv(csv_path, index=False, encoding="utf-8-sig")
-              # So khớp khóa ngoại nếu khởi tạo thành công
-            fk_results = None
-            fk_ratio = 0
-            if fk_initialized:
-                with connection.open_conn(server, user, pw, database='00000001') as ans_conn, \
-                     connection.open_conn(server, user, pw, database=db_name) as stu_conn:
+        # Một cặp kết nối đáp án/sinh viên dùng chung cho FK, row count và view
+        with connection.open_conn_pair(server, user, pw, '00000001', db_name) as (ans_conn, stu_conn):
+            seed_row_count_cache(ans_conn, _answer_db_read('row_counts', lambda: get_all_row_counts_fast(ans_conn)))
+            # Lưu kết quả chi tiết
+            if all_rows:
+                os.makedirs(out_dir, exist_ok=True)
+                csv_path = os.path.join(out_dir, f"{db_name}_pairs.csv")
+                pd.DataFrame(all_rows, columns=[
+                    'AnsTbl','AnsCol','AnsType','StuTbl','StuCol','StuType','Cos','Match'
+                ]).to_csv(csv_path, index=False, encoding="utf-8-sig")
+                  # So khớp khóa ngoại nếu khởi tạo thành công
+                fk_results = None
+                fk_ratio = 0
+                if fk_initialized:
                     # Khởi tạo bảng ForeignKeyInfo cho cả hai database
-                    ans_ok = initialize_database(ans_conn)
+                    if answer_fk_ready is None:
+                        ans_ok = answer_fk_initialized = initialize_database(ans_conn)
+                    else:
+                        ans_ok = answer_fk_ready
                     stu_ok = initialize_database(stu_conn)
                     
                     if ans_ok and stu_ok:
                         fk_results, fk_ratio = compare_foreign_keys(
                             ans_conn, stu_conn, mapping,
-                            os.path.join(out_dir, f"{db_name}_fk.csv")
+                            os.path.join(out_dir, f"{db_name}_fk.csv"),
+                            ans_fks=_answer_db_read('fks', lambda: get_foreign_keys_from_info(ans_conn))
                         )                        # Kiểm tra row count sau khi đã kiểm tra foreign key
                         row_count_results = None
                         if check_row_counts:
@@ -73,39 +103,33 @@ def run_for_one_bak(bak_path, server, user, pw, data_folder,
                             row_count_results = check_mapped_table_row_counts(ans_conn, stu_conn, mapping, answer_schema)
                             
                             # Lưu kết quả row count
-                            row_count_csv = format_row_count_results(row_count_results, db_name)
-                            if row_count_csv:
-                                row_count_df = pd.DataFrame(row_count_csv)
+                            row_count_df = format_row_count_dataframe(row_count_results, db_name)
+                            if not row_count_df.empty:
                                 row_count_path = os.path.join(out_dir, f"{db_name}_rowcount.csv")
                                 row_count_df.to_csv(row_count_path, index=False, encoding="utf-8-sig")
                                 print(f"Row count results saved to {row_count_path}")
                     else:
                         print(f"Warning: Foreign key info table initialization failed for {db_name}")
               
-              # Kiểm tra row count ngay cả khi không có foreign key check
-            row_count_results = None
-            if check_row_counts and not fk_initialized:
-                with connection.open_conn(server, user, pw, database='00000001') as ans_conn, \
-                     connection.open_conn(server, user, pw, database=db_name) as stu_conn:
+                  # Kiểm tra row count ngay cả khi không có foreign key check
+                row_count_results = None
+                if check_row_counts and not fk_initialized:
                     
                     print(f"Checking row counts for {db_name} (no FK check)...")
                     row_count_results = check_mapped_table_row_counts(ans_conn, stu_conn, mapping, answer_schema)
                     
                     # Lưu kết quả row count
-                    row_count_csv = format_row_count_results(row_count_results, db_name)
-                    if row_count_csv:
-                        row_count_df = pd.DataFrame(row_count_csv)
+                    row_count_df = format_row_count_dataframe(row_count_results, db_name)
+                    if not row_count_df.empty:
                         row_count_path = os.path.join(out_dir, f"{db_name}_rowcount.csv")
                         row_count_df.to_csv(row_count_path, index=False, encoding="utf-8-sig")
                         print(f"Row count results saved to {row_count_path}")
         
-        # Tính điểm schema
-        schema_score, table_results = calc_schema_score(answer_schema, student_schema)
+            # Tính điểm schema
+            schema_score, table_results = calc_schema_score(answer_schema, student_schema)
         
-        # So khớp view và lưu file view trước khi xóa database
-        with connection.open_conn(server, user, pw, database='00000001') as ans_conn, \
-             connection.open_conn(server, user, pw, database=db_name) as stu_conn:
-            answer_views = get_views_info(ans_conn)
+            # So khớp view và lưu file view trước khi xóa database
+            answer_views = _answer_db_read('views', lambda: get_views_info(ans_conn))
             student_views = get_views_info(stu_conn)
             view_results = []
             for ans_view in answer_views:
@@ -154,26 +178,113 @@ def run_for_one_bak(bak_path, server, user, pw, data_folder,
         return {}
         
     finally:
-        # Luôn xóa database khi xong việc
-        if db_name:
+        if answer_fk_initialized:
+            # Chấm lẻ: bảng ForeignKeyInfo của DB đáp án do lần chấm này tạo
+            _drop_answer_fk_info(server, user, pw)
+        if db_name and restore_cache_dir:
+            # Giữ database để dùng lại, chỉ gỡ bảng ForeignKeyInfo do bước chấm tạo ra
+            # để lần sau đọc được đúng schema như lúc vừa restore
+            if fk_table_created:
+                try:
+                    with connection.scoped_conn(server, user, pw, database=db_name) as conn:
+                        drop_fk_info_table(conn)
+                except Exception as e:
+                    print(f"Không thể dọn ForeignKeyInfo trong {db_name}: {e}")
+        elif db_name:
+            # Xóa database khi xong việc
             drop_database(server, user, pw, db_name)
 
 
-def run_batch(bak_folder, answer_db_schema, server, user, pw, data_folder, out_dir, check_row_counts=True):
-    """Chấm hàng loạt file .bak trong thư mục"""
-    results = []
+# Tham số chung cho các worker khi chấm song song (gửi một lần qua initializer)
+_WORKER_ARGS = None
+
+def _init_worker(*args):
+    global _WORKER_ARGS
+    _WORKER_ARGS = args
+    _ANSWER_DB_CACHE.clear()
+
+def _grade_in_worker(bak_path):
+    (server, user, pw, data_folder, answer_schema, out_dir, check_row_counts,
+     answer_fk_ready, restore_cache_dir) = _WORKER_ARGS
+    return run_for_one_bak(bak_path, server, user, pw, data_folder, answer_schema, out_dir,
+                           check_row_counts, answer_fk_ready=answer_fk_ready,
+                           restore_cache_dir=restore_cache_dir)
+
+
+def _drop_answer_fk_info(server, user, pw):
+    try:
+        with connection.scoped_conn(server, user, pw, database='00000001') as ans_conn:
+            drop_fk_info_table(ans_conn)
+    except Exception as e:
+        print(f"Không thể dọn ForeignKeyInfo trong 00000001: {e}")
+
+
+def _grade_all(bak_paths, all_res, server, user, pw, data_folder, answer_db_schema, out_dir,
+               check_row_counts, max_workers, answer_fk_ready, restore_cache_dir):
+    """Chấm các file trong bak_paths, ghi kết quả vào all_res theo đúng thứ tự."""
+    if max_workers > 1 and len(bak_paths) > 1:
+        # Các file restore ra cùng tên database không được chấm đồng thời:
+        # file đầu tiên của mỗi tên chạy song song, các file trùng tên chạy tuần tự sau đó
+        parallel, serial, seen = [], [], set()
+        for idx, bak_path in enumerate(bak_paths):
+            name = restore.db_name_for_bak(bak_path)
+            (serial if name in seen else parallel).append(idx)
+            seen.add(name)
+
+        # Các worker tự mở kết nối riêng, không kế thừa kết nối rảnh của tiến trình này
+        connection.pool.close_all()
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(server, user, pw, data_folder, answer_db_schema,
+                                           out_dir, check_row_counts, answer_fk_ready,
+                                           restore_cache_dir)) as ex:
+            for idx, res in zip(parallel, ex.map(_grade_in_worker, [bak_paths[i] for i in parallel])):
+                all_res[idx] = res
+    else:
+        serial = range(len(bak_paths))
+    for idx in serial:
+        all_res[idx] = run_for_one_bak(bak_paths[idx], server, user, pw, data_folder,
+                                       answer_db_schema, out_dir, check_row_counts,
+                                       answer_fk_ready=answer_fk_ready,
+                                       restore_cache_dir=restore_cache_dir)
+
+
+def run_batch(bak_folder, answer_db_schema, server, user, pw, data_folder, out_dir, check_row_counts=True,
+              max_workers=None, restore_cache_dir=None):
+    """Chấm hàng loạt file .bak trong thư mục
+
+    max_workers: số tiến trình chấm song song (mặc định min(số CPU, 4)); 1 để chấm tuần tự.
+    restore_cache_dir: thư mục lưu fingerprint các file .bak đã restore; nếu có, database
+                       sinh viên được giữ lại và chỉ restore lại khi file .bak thay đổi.
+    """
+    bak_paths = []
     for bak in os.listdir(bak_folder):
         ext = os.path.splitext(bak)[1].lower()
         if ext == '.bak' and bak.lower() != 'dapan.bak':
             bak_path = os.path.join(bak_folder, bak)
-            if not os.path.isfile(bak_path):
-                continue
-            
-            res = run_for_one_bak(bak_path, server, user, pw,
-                                 data_folder, answer_db_schema, out_dir, check_row_counts)
-            if res:
-                results.append(res)
-                
+            if os.path.isfile(bak_path):
+                bak_paths.append(bak_path)
+
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 1, 4)
+
+    all_res = [None] * len(bak_paths)
+    _ANSWER_DB_CACHE.clear()
+    answer_fk_ready = None
+    if bak_paths:
+        # ForeignKeyInfo của DB đáp án được dựng một lần cho cả lượt chấm, các bài chỉ đọc
+        with connection.scoped_conn(server, user, pw, database='00000001') as ans_conn:
+            answer_fk_ready = initialize_database(ans_conn)
+    try:
+        _grade_all(bak_paths, all_res, server, user, pw, data_folder, answer_db_schema, out_dir,
+                   check_row_counts, max_workers, answer_fk_ready, restore_cache_dir)
+    finally:
+        if bak_paths:
+            # DB đáp án có thể được dùng lại ở lần chạy sau (restore marker),
+            # không để lại bảng ForeignKeyInfo do bước chấm tạo ra
+            _drop_answer_fk_info(server, user, pw)
+
+    results = [res for res in all_res if res]
+
     save_schema_results_csv(results, os.path.join(out_dir, "schema_grading_results.csv"))
 
     # Save row count summary if any results have row count data
@@ -5,8 +5,11 @@ This module checks if students correctly implemented business logic
 by comparing row counts between student and answer databases for ALL mapped tables.
 """
 
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
 from typing import Dict, List, Tuple, Optional
-from ..db import connection
+import pandas as pd
+from ..db.connection import ConnectionCache
 from ..utils.log import get_logger
 
 logger = get_logger(__name__)
@@ -26,34 +29,130 @@ BUSINESS_LOGIC_CHANGES = {
     'ChiTietMuaHang': 1   # +1 Purchase detail for order #71
 }
 
+# Tên bảng nghiệp vụ chuẩn hóa (không phân biệt hoa thường), tính một lần
+_BUSINESS_KEYS = frozenset(tbl.lower() for tbl in BUSINESS_LOGIC_CHANGES)
+
+# Dòng CSV mặc định khi phân tích row count bị lỗi (chỉ đọc, điền MSSV/Ghi chú khi dùng)
+_ERROR_ROW = MappingProxyType({
+    'MSSV': '',
+    'Tên bảng đáp án': 'ERROR',
+    'Tên bảng sinh viên': 'ERROR',
+    'Số dòng đáp án': 0,
+    'Số dòng sinh viên': 0,
+    'Chênh lệch': 0,
+    'Đã nhập đúng dữ liệu': 0,
+    'Đã nhập đúng nghiệp vụ': 0,
+    'Là bảng nghiệp vụ': 0,
+    'Điểm nghiệp vụ': '0/5',
+    'Trạng thái': 'Lỗi',
+    'Ghi chú': ''
+})
+
+# Row counts of user tables per connection: {table_name: count}
+_ROW_COUNT_CACHE = ConnectionCache()
+
+def _quote_name(name: str) -> str:
+    """Python equivalent of T-SQL QUOTENAME for identifiers."""
+    return "[" + name.replace("]", "]]") + "]"
+
+# Parameterized single-table fast count: one cached plan for every table name
+_ROWCOUNT_SQL = ("SELECT SUM(row_count) FROM sys.dm_db_partition_stats "
+                 "WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)")
+
+def get_all_row_counts_fast(conn) -> Dict[str, int]:
+    """
+    Get row counts of all user tables in one metadata query.
+
+    Reads sys.dm_db_partition_stats (heap/clustered index partitions) instead of
+    scanning every table with COUNT(*). The result is cached per connection.
+
+    Returns:
+        Dict of {table name: row count}. Names that exist in more than
+        one schema are left out so callers fall back to an exact COUNT_BIG(*).
+        Empty dict if the metadata query fails (e.g. missing VIEW DATABASE STATE).
+    """
+    cached = _ROW_COUNT_CACHE.get(conn)
+    if cached is not None:
+        return cached
+
+    counts: Dict[str, int] = {}
+    try:
+        cursor = conn.cursor()
+        cursor.arraysize = 1000
+        cursor.execute("""
+            SELECT o.name, SUM(ps.row_count)
+            FROM sys.dm_db_partition_stats ps
+            JOIN sys.objects o ON ps.object_id = o.object_id
+            WHERE ps.index_id IN (0, 1) AND o.type = 'U'
+            GROUP BY o.schema_id, o.name""")
+        ambiguous = set()
+        for name, count in (row for rows in iter(cursor.fetchmany, []) for row in rows):
+            if name in counts:
+                ambiguous.add(name)
+            counts[name] = int(count or 0)
+        for name in ambiguous:
+            del counts[name]
+    except Exception as e:
+        logger.debug(f"Fast row count query failed, falling back to COUNT_BIG(*): {e}")
+        counts = {}
+
+    seed_row_count_cache(conn, counts)
+    return counts
+
+def seed_row_count_cache(conn, counts: Dict[str, int]) -> None:
+    """Use counts already read for the same database (e.g. the answer DB on an earlier connection)."""
+    _ROW_COUNT_CACHE.put(conn, counts)
+
+def invalidate_row_count_cache(conn=None) -> None:
+    """Drop cached row counts for a connection (or all connections), e.g. after DML."""
+    _ROW_COUNT_CACHE.invalidate(conn)
+
 def get_table_row_count(conn, table_name: str) -> int:
     """Get row count for a specific table."""
     if not table_name or table_name == 'NOT_MAPPED' or table_name == 'ERROR_TABLE': # Added checks for invalid table names
         logger.warning(f"Invalid table name provided for row count: {table_name}")
         return -1
+
+    # Served from the per-connection metadata counts when the table is known there
+    fast_counts = get_all_row_counts_fast(conn)
+    count = fast_counts.get(table_name)
+    if count is not None:
+        logger.debug(f"Table [{table_name}]: {count} rows (partition stats)")
+        return count
+
     try:
         cursor = conn.cursor()
+
+        if fast_counts:
+            # Names missing from the snapshot (ambiguous across schemas, created later):
+            # resolve through OBJECT_ID like an unqualified name would. NULL for views.
+            try:
+                count = cursor.execute(_ROWCOUNT_SQL, _quote_name(table_name)).fetchval()
+                if count is not None:
+                    count = int(count)
+                    logger.debug(f"Table [{table_name}]: {count} rows (partition stats)")
+                    return count
+            except Exception as e:
+                logger.debug(f"Partition stats lookup failed for {table_name}: {e}")
         
         # Standard SQL Server quoting for table names that might contain spaces or special characters
         # The schema_reader and build_schema should provide the original, unquoted name.
         # Quoting here ensures it's handled correctly by the DB.
         # It's generally safer to always quote, as it doesn't harm simple names.
-        quoted_table_name = f"[{table_name}]"
+        quoted_table_name = _quote_name(table_name)
 
         try:
             # Attempt with just the quoted table name (most common if DB context is correct)
-            cursor.execute(f"SELECT COUNT_BIG(*) FROM {quoted_table_name}") # Use COUNT_BIG for potentially large tables
-            result = cursor.fetchone()
-            count = result[0] if result else 0
+            count = cursor.execute(f"SELECT COUNT_BIG(*) FROM {quoted_table_name}{_COUNT_HINT}").fetchval() # Use COUNT_BIG for potentially large tables
+            count = int(count) if count is not None else 0
             logger.debug(f"Table {quoted_table_name}: {count} rows")
             return count
         except Exception as e1:
             logger.debug(f"Failed querying {quoted_table_name}: {e1}. Trying with 'dbo' schema.")
             try:
                 # Try with 'dbo' schema explicitly
-                cursor.execute(f"SELECT COUNT_BIG(*) FROM dbo.{quoted_table_name}")
-                result = cursor.fetchone()
-                count = result[0] if result else 0
+                count = cursor.execute(f"SELECT COUNT_BIG(*) FROM dbo.{quoted_table_name}{_COUNT_HINT}").fetchval()
+                count = int(count) if count is not None else 0
                 logger.debug(f"Table dbo.{quoted_table_name}: {count} rows")
                 return count
             except Exception as e2:
@@ -64,6 +163,54 @@ def get_table_row_count(conn, table_name: str) -> int:
         logger.error(f"Error counting rows in table '{table_name}': {e}")
         return -1
 
+# Tables per UNION ALL batch, keeps each statement well below parser limits
+_COUNT_BATCH_SIZE = 500
+
+# Counts read without taking shared locks (same as READ UNCOMMITTED, scoped to the
+# statement so the session isolation level is untouched). Graded databases are
+# freshly restored and not written concurrently, so no dirty rows are expected.
+_COUNT_HINT = " WITH (NOLOCK)"
+
+def get_table_row_counts(conn, table_names: List[str]) -> Dict[str, int]:
+    """
+    Get row counts for several tables with as few round-trips as possible.
+
+    Tables known to get_all_row_counts_fast are served from it; the rest are
+    counted with one UNION ALL statement per batch. If a batch fails (e.g. one
+    of the tables does not exist), its tables are counted one by one with
+    get_table_row_count so errors stay per table (-1).
+
+    Returns:
+        Dict of {table name: row count or -1}
+    """
+    fast_counts = get_all_row_counts_fast(conn)
+    counts: Dict[str, int] = {}
+    pending = []
+    for name in dict.fromkeys(table_names):
+        if not name or name == 'NOT_MAPPED' or name == 'ERROR_TABLE':
+            continue
+        if name in fast_counts:
+            counts[name] = fast_counts[name]
+        else:
+            pending.append(name)
+
+    for start in range(0, len(pending), _COUNT_BATCH_SIZE):
+        batch = pending[start:start + _COUNT_BATCH_SIZE]
+        sql = " UNION ALL ".join(
+            "SELECT N'{}', COUNT_BIG(*) FROM {}{}".format(name.replace("'", "''"), _quote_name(name), _COUNT_HINT)
+            for name in batch
+        )
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql)
+            counts.update((name, int(count)) for name, count in cursor.fetchall())
+        except Exception as e:
+            logger.debug(f"Batched row count failed, counting {len(batch)} tables one by one: {e}")
+            for name in batch:
+                counts[name] = get_table_row_count(conn, name)
+
+    return counts
+
 def check_mapped_table_row_counts(answer_conn, student_conn, table_mapping: Dict[str, Dict[str, Optional[str]]], answer_schema: Dict[str, Dict]) -> Dict:
     """
     Compare row counts for ALL mapped tables from stage 1 matching.
@@ -114,8 +261,20 @@ def check_mapped_table_row_counts(answer_conn, student_conn, table_mapping: Dict
         # We assume answer table names for querying are their cleaned names (e.g., "NhaCungCap")
         # For student tables, we MUST use 'student_original_name' for querying.
 
-        # Chuẩn hóa tên bảng để so sánh không phân biệt hoa thường
-        business_keys = {tbl.lower() for tbl in BUSINESS_LOGIC_CHANGES}
+        # Fetch all counts up front: one batch per connection instead of two queries per table
+        counted = [
+            (ans_cleaned_table, stu_map_info.get('student_original_name'))
+            for ans_cleaned_table, stu_map_info in table_mapping.items()
+            if stu_map_info and stu_map_info.get('student_original_name') not in (None, '', 'NOT_MAPPED')
+        ]
+        # The two databases are queried concurrently, each on its own connection
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            f_answer = ex.submit(get_table_row_counts, answer_conn, [
+                answer_schema.get(ans_cleaned_table, {}).get('original_name', ans_cleaned_table)
+                for ans_cleaned_table, _ in counted
+            ])
+            f_student = ex.submit(get_table_row_counts, student_conn, [stu_original for _, stu_original in counted])
+            answer_counts, student_counts = f_answer.result(), f_student.result()
 
         for ans_cleaned_table, stu_map_info in table_mapping.items():
             # Retrieve original answer table name for querying
@@ -151,8 +310,12 @@ def check_mapped_table_row_counts(answer_conn, student_conn, table_mapping: Dict
             # Get row counts
             # For answer_db, query using ans_cleaned_table.
             # For student_db, query using student_original_table.
-            answer_count = get_table_row_count(answer_conn, ans_original_table)
-            student_count = get_table_row_count(student_conn, student_original_table)
+            answer_count = answer_counts.get(ans_original_table)
+            if answer_count is None:
+                answer_count = get_table_row_count(answer_conn, ans_original_table)
+            student_count = student_counts.get(student_original_table)
+            if student_count is None:
+                student_count = get_table_row_count(student_conn, student_original_table)
             
             logger.info(f"Row counts - Answer '{ans_original_table}': {answer_count}, Student '{student_original_table}': {student_count}")
             
@@ -296,79 +459,99 @@ def check_mapped_table_row_counts(answer_conn, student_conn, table_mapping: Dict
     
     return result
 
-def format_row_count_results(row_count_results: Dict, student_id: str) -> List[Dict]:
-    """Format comprehensive row count results for CSV output."""
-    csv_rows = []
+# Thứ tự cột của file CSV row count
+_ROW_COUNT_COLUMNS = tuple(_ERROR_ROW)
+
+def _classify_row(diff_class: int, is_business_table: bool) -> Tuple[str, str, str, str]:
+    """Phân loại một dòng (không lỗi) theo chênh lệch: 0, -1 hoặc khác (1)."""
+    # --- TÍNH LẠI 2 FLAG THEO YÊU CẦU ---
+    if diff_class == 0:
+        data_ok = True
+        biz_ok = True
+    elif diff_class == -1 and is_business_table:
+        data_ok = True
+        biz_ok = False
+    else:
+        data_ok = False
+        biz_ok = False
+
+    # --- CẬP NHẬT STATUS VÀ NOTE ---
+    if data_ok and biz_ok:
+        status = 'Đúng nghiệp vụ'
+        note = 'Dữ liệu và nghiệp vụ đều đúng.'
+    elif data_ok and not is_business_table:
+        status = 'Khớp dữ liệu'
+        note = 'Số dòng khớp chính xác.'
+    elif is_business_table:
+        status = 'Sai nghiệp vụ'
+        note = "Chênh lệch {difference}, dữ liệu hoặc nghiệp vụ sai."
+    else:
+        status = 'Sai lệch dữ liệu'
+        note = "Chênh lệch {difference} dòng so với đáp án."
+
+    return ('Có' if data_ok else 'Không'), ('Có' if biz_ok else 'Không'), status, note
+
+# (diff_class, is_business_table) -> (data_text, biz_text, status, note template)
+_ROW_STATUS = {
+    (diff_class, is_business): _classify_row(diff_class, is_business)
+    for diff_class in (0, -1, 1) for is_business in (True, False)
+}
+
+def _row_count_columns(row_count_results: Dict, student_id: str) -> Dict[str, list]:
+    """Build the row count CSV as parallel column lists (one list per CSV column)."""
+    columns: Dict[str, list] = {name: [] for name in _ROW_COUNT_COLUMNS}
     if 'error' in row_count_results:
-        return [{
-            'MSSV': student_id,
-            'Tên bảng đáp án': 'ERROR',
-            'Tên bảng sinh viên': 'ERROR',
-            'Số dòng đáp án': 0,
-            'Số dòng sinh viên': 0,
-            'Chênh lệch': 0,
-            'Đã nhập đúng dữ liệu': 0,
-            'Đã nhập đúng nghiệp vụ': 0,
-            'Là bảng nghiệp vụ': 0,
-            'Điểm nghiệp vụ': '0/5',
-            'Trạng thái': 'Lỗi',
-            'Ghi chú': str(row_count_results['error'])
-        }]
+        for name, value in _ERROR_ROW.items():
+            columns[name].append(value)
+        columns['MSSV'][0] = student_id
+        columns['Ghi chú'][0] = str(row_count_results['error'])
+        return columns
+
     mapped_tables = row_count_results.get('mapped_tables', {})
     summary = row_count_results.get('summary', {})
-    business_keys = {tbl.lower() for tbl in BUSINESS_LOGIC_CHANGES}
+    # Same score text for every row of this student
+    score_text = f"{summary.get('business_logic_score',0)}/{summary.get('business_logic_max',0)}"
+
+    (col_mssv, col_ans, col_stu, col_ans_rows, col_stu_rows, col_diff,
+     col_data, col_biz, col_is_biz, col_score, col_status, col_note) = columns.values()
+
     for answer_table_cleaned, table_data in mapped_tables.items():
-        is_business_table = answer_table_cleaned.lower() in business_keys
+        is_business_table = answer_table_cleaned.lower() in _BUSINESS_KEYS
         answer_count = table_data.get('answer_count', 0)
         student_count = table_data.get('student_count', 0)
         difference = table_data.get('difference', 0)
         student_display = table_data.get('student_table_original_for_query', table_data.get('student_table_cleaned', 'N/A'))
         error = table_data.get('error')
 
-        # --- TÍNH LẠI 2 FLAG THEO YÊU CẦU ---
-        if difference == 0:
-            data_ok = True
-            biz_ok = True
-        elif difference == -1 and is_business_table:
-            data_ok = True
-            biz_ok = False
-        else:
-            data_ok = False
-            biz_ok = False
-
-        data_text = 'Có' if data_ok else 'Không'
-        biz_text  = 'Có' if biz_ok  else 'Không'
-
-        # --- CẬP NHẬT STATUS VÀ NOTE ---
+        # --- FLAG / STATUS / NOTE TRA TỪ BẢNG ---
+        data_text, biz_text, status, note = _ROW_STATUS[
+            (0 if difference == 0 else -1 if difference == -1 else 1, is_business_table)
+        ]
         if error or student_display == 'NOT_MAPPED':
             status = 'Lỗi'
             note = error if error else 'Không tìm thấy bảng tương ứng của sinh viên.'
-        elif data_ok and biz_ok:
-            status = 'Đúng nghiệp vụ'
-            note = 'Dữ liệu và nghiệp vụ đều đúng.'
-        elif data_ok and not is_business_table:
-            status = 'Khớp dữ liệu'
-            note = 'Số dòng khớp chính xác.'
-        else:
-            if is_business_table:
-                status = 'Sai nghiệp vụ'
-                note = f"Chênh lệch {difference}, dữ liệu hoặc nghiệp vụ sai."
-            else:
-                status = 'Sai lệch dữ liệu'
-                note = f"Chênh lệch {difference} dòng so với đáp án."
-
-        csv_rows.append({
-            'MSSV': student_id,
-            'Tên bảng đáp án': answer_table_cleaned,
-            'Tên bảng sinh viên': student_display,
-            'Số dòng đáp án': answer_count if not error else 'Lỗi',
-            'Số dòng sinh viên': student_count if not error else 'Lỗi',
-            'Chênh lệch': difference if not error else 'Lỗi',
-            'Đã nhập đúng dữ liệu': data_text,
-            'Đã nhập đúng nghiệp vụ': biz_text,
-            'Là bảng nghiệp vụ': 'Có' if is_business_table else 'Không',
-            'Điểm nghiệp vụ': f"{summary.get('business_logic_score',0)}/{summary.get('business_logic_max',0)}",
-            'Trạng thái': status,
-            'Ghi chú': note
-        })
-    return csv_rows
+        elif '{' in note:
+            note = note.format(difference=difference)
+
+        col_mssv.append(student_id)
+        col_ans.append(answer_table_cleaned)
+        col_stu.append(student_display)
+        col_ans_rows.append(answer_count if not error else 'Lỗi')
+        col_stu_rows.append(student_count if not error else 'Lỗi')
+        col_diff.append(difference if not error else 'Lỗi')
+        col_data.append(data_text)
+        col_biz.append(biz_text)
+        col_is_biz.append('Có' if is_business_table else 'Không')
+        col_score.append(score_text)
+        col_status.append(status)
+        col_note.append(note)
+    return columns
+
+def format_row_count_dataframe(row_count_results: Dict, student_id: str) -> pd.DataFrame:
+    """Format comprehensive row count results as a DataFrame ready for to_csv."""
+    return pd.DataFrame(_row_count_columns(row_count_results, student_id))
+
+def format_row_count_results(row_count_results: Dict, student_id: str) -> List[Dict]:
+    """Format comprehensive row count results for CSV output."""
+    columns = _row_count_columns(row_count_results, student_id)
+    return [dict(zip(_ROW_COUNT_COLUMNS, values)) for values in zip(*columns.values())]
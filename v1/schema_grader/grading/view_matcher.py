@@ -1,7 +1,11 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 import os
 import pandas as pd
-from .row_count_checker import get_table_row_count
+from ..db.connection import ConnectionCache
+from .row_count_checker import get_table_row_count, get_table_row_counts
+from ..utils.log import get_logger
+
+logger = get_logger(__name__)
 
 # Naming convention for output CSVs:
 # - Table pairs:       {student_id}_pairs.csv
@@ -9,28 +13,42 @@ from .row_count_checker import get_table_row_count
 # - Row counts:        {student_id}_rowcount.csv
 # - View matches:      {student_id}_views.csv  # <- this module
 
+# Catalog (view name, column count) per connection: [(view_name, num_columns)]
+_VIEW_CATALOG_CACHE = ConnectionCache()
+
+def _get_view_catalog(conn) -> List[Tuple[str, int]]:
+    """Đọc tên view và số cột trong một truy vấn, cache theo connection."""
+    cached = _VIEW_CATALOG_CACHE.get(conn)
+    if cached is not None:
+        return cached
+
+    cursor = conn.cursor()
+    cursor.arraysize = 1000
+    cursor.execute("""
+        SELECT v.TABLE_NAME,
+               (SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS c WHERE c.TABLE_NAME = v.TABLE_NAME)
+        FROM INFORMATION_SCHEMA.VIEWS v""")
+    catalog = [(view_name, num_columns)
+               for rows in iter(cursor.fetchmany, []) for view_name, num_columns in rows]
+
+    _VIEW_CATALOG_CACHE.put(conn, catalog)
+    return catalog
+
+def invalidate_view_cache(conn=None) -> None:
+    """Xóa catalog view đã cache của một connection (hoặc tất cả), dùng khi có DDL."""
+    _VIEW_CATALOG_CACHE.invalidate(conn)
+
 def get_views_info(conn) -> List[Dict[str, Any]]:
     """
     Lấy danh sách view trong database với số cột và số dòng.
     Returns: List[Dict] với keys: view_name, num_columns, num_rows
     """
-    views = []
-    cursor = conn.cursor()
-    cursor.execute("SELECT TABLE_NAME FROM INFORMATION_SCHEMA.VIEWS")
-    for (view_name,) in cursor.fetchall():
-        cursor.execute("SELECT COUNT(*) FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = ?", (view_name,))
-        num_columns = cursor.fetchone()[0]
-        try:
-            cursor.execute(f"SELECT COUNT(*) FROM [{view_name}]")
-            num_rows = cursor.fetchone()[0]
-        except Exception:
-            num_rows = -1
-        views.append({
-            "view_name": view_name,
-            "num_columns": num_columns,
-            "num_rows": num_rows
-        })
-    return views
+    catalog = _get_view_catalog(conn)
+    counts = get_table_row_counts(conn, [view_name for view_name, _ in catalog])
+    return [
+        {"view_name": view_name, "num_columns": num_columns, "num_rows": counts.get(view_name, -1)}
+        for view_name, num_columns in catalog
+    ]
 
 def match_views(
     answer_schema: Dict[str, Dict[str, Any]],
@@ -60,16 +78,27 @@ def match_views(
     """
     results: List[Dict[str, Any]] = []
 
+    # Đếm dòng của tất cả view mỗi bên trong một lượt truy vấn
+    ans_counts = get_table_row_counts(
+        ans_conn, [info.get('original_name', name) for name, info in answer_schema.items()])
+    stu_counts = get_table_row_counts(
+        stu_conn, [student_schema[name].get('original_name', name)
+                   for name in answer_schema if student_schema.get(name)])
+
     for view_name, ans_info in answer_schema.items():
         original_view = ans_info.get('original_name', view_name)
         ans_cols = len(ans_info.get('cols', []))
-        ans_rows = get_table_row_count(ans_conn, original_view)
+        ans_rows = ans_counts.get(original_view)
+        if ans_rows is None:
+            ans_rows = get_table_row_count(ans_conn, original_view)
 
         stu_info = student_schema.get(view_name)
         if stu_info:
             stu_original = stu_info.get('original_name', view_name)
             stu_cols = len(stu_info.get('cols', []))
-            stu_rows = get_table_row_count(stu_conn, stu_original)
+            stu_rows = stu_counts.get(stu_original)
+            if stu_rows is None:
+                stu_rows = get_table_row_count(stu_conn, stu_original)
         else:
             stu_cols = 0
             stu_rows = -1
@@ -111,4 +140,4 @@ def save_view_matches_to_csv(
     output_file = os.path.join(out_dir, f"{student_id}_views.csv")
     # If no rows, still write header
     df.to_csv(output_file, index=False, encoding='utf-8-sig')
-    print(f"[DEBUG] save_view_matches_to_csv: Saved {len(df)} matches to {output_file}")
+    logger.debug("save_view_matches_to_csv: Saved %d matches to %s", len(df), output_file)
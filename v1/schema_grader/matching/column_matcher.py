@@ -33,9 +33,9 @@ def semantic_similarity_gemini(col1: str, type1: str, col2: str, type2: str) ->
         embed2 = embed(f"{col2} {type2}")
         
         # Calculate cosine similarity
-        dot_product = sum(a * b for a, b in zip(embed1, embed2))
-        norm1 = sum(a * a for a in embed1) ** 0.5
-        norm2 = sum(b * b for b in embed2) ** 0.5
+        dot_product = np.dot(embed1, embed2)
+        norm1 = np.linalg.norm(embed1)
+        norm2 = np.linalg.norm(embed2)
         
         if norm1 == 0 or norm2 == 0:
             return 0.0
@@ -68,20 +68,24 @@ def phase2_one(ans_tbl, stu_tbl, ans_schema, stu_schema):
         return [[ans_tbl, c, d, stu_tbl, "—", "—", 0.0, False] for c, d in ans_cols]    # Bước 1: name-match trực tiếp  
     matched_idx_stu = set()
     rows = []
+    # Khóa so khớp exact của mỗi cột (canonical, canonical bỏ space, lower), tính một lần
+    # thay vì gọi canonical() cho từng cặp cột
+    def exact_keys(col):
+        col_canonical = canonical(col)
+        return col_canonical, col_canonical.replace(' ', ''), col.lower()
+    stu_keys = [exact_keys(cS) for cS, _ in stu_cols]
     for i, (cA, tA) in enumerate(ans_cols):
+        a_canonical, a_nospace, a_lower = exact_keys(cA)
         hit = None
         for j, (cS, tS) in enumerate(stu_cols):
             if j in matched_idx_stu:  # đã dùng
                 continue
             
-            # Kiểm tra exact match với nhiều cách so sánh
-            cA_canonical = canonical(cA)
-            cS_canonical = canonical(cS)
-            
             # So sánh trực tiếp hoặc loại bỏ spaces
-            exact_match = (cA_canonical == cS_canonical or 
-                          cA_canonical.replace(' ', '') == cS_canonical.replace(' ', '') or
-                          cA.lower() == cS.lower())
+            s_canonical, s_nospace, s_lower = stu_keys[j]
+            exact_match = (a_canonical == s_canonical or
+                          a_nospace == s_nospace or
+                          a_lower == s_lower)
             
             if exact_match:
                 ok = same_type(tA, tS, cA, cS)
@@ -5,7 +5,7 @@ This module provides intelligent table matching between answer and student schem
 using column similarity analysis and embedding-based semantic matching.
 """
 
-from typing import Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import numpy as np
 from scipy.optimize import linear_sum_assignment
 
@@ -13,22 +13,26 @@ from ..embedding.gemini import embed
 from .cosine import cosine_mat
 from ..utils.alias_maps import TABLE_ALIAS
 from ..utils.normalizer import canonical
-from ..utils.fuzzy import smart_token_match
+from ..utils.fuzzy import smart_token_match, smart_token_match_matrix
 
 
 def count_matching_columns(ans_cols: List[Tuple[str, str]], 
                           stu_cols: List[Tuple[str, str]], 
-                          match_threshold: int = 70) -> int:
+                          match_threshold: int = 70,
+                          score_fn: Optional[Callable[[str, str], float]] = None) -> int:
     """Count matching columns between two tables.
     
     Args:
         ans_cols: List of (name, type) tuples from answer table
         stu_cols: List of (name, type) tuples from student table
         match_threshold: Threshold for fuzzy matching (lowered from 80 to 70)
+        score_fn: Column name scorer, defaults to smart_token_match
     
     Returns:
         int: Number of matching column pairs
     """
+    if score_fn is None:
+        score_fn = smart_token_match
     count = 0
     used_stu_cols = set()
     
@@ -38,13 +42,11 @@ def count_matching_columns(ans_cols: List[Tuple[str, str]],
                 continue
                 
             # Kiểm tra tên cột bằng nhiều cách
-            smart_score = smart_token_match(ac, sc)
-            exact_match = canonical(ac) == canonical(sc) or \
-                         canonical(ac).replace(' ', '') == canonical(sc).replace(' ', '') or \
-                         ac.lower() == sc.lower()
-            
-            # Match nếu exact hoặc smart_token_match đủ cao
-            if exact_match or smart_score >= match_threshold:
+            # Match nếu smart_token_match đủ cao hoặc exact
+            if score_fn(ac, sc) >= match_threshold or \
+                    canonical(ac) == canonical(sc) or \
+                    canonical(ac).replace(' ', '') == canonical(sc).replace(' ', '') or \
+                    ac.lower() == sc.lower():
                 # Kiểm tra type tương thích (linh hoạt hơn)
                 type_compatible = (at.lower() == st.lower() or 
                                  # String types tương thích với nhau
@@ -84,13 +86,24 @@ def phase1(ans_schema: Dict[str, Dict], stu_schema: Dict[str, Dict], TBL_TH: flo
             mapping[a_tbl_cleaned] = {'student_table': None, 'student_original_name': None}
         return mapping
 
+    # Điểm tên cột cho mọi cặp cột đáp án × sinh viên, tính một lần bằng rapidfuzz
+    ans_col_idx = {c: k for k, c in enumerate(dict.fromkeys(
+        c for t in ans_cleaned_names for c, _ in ans_schema[t]['cols']))}
+    stu_col_idx = {c: k for k, c in enumerate(dict.fromkeys(
+        c for t in stu_cleaned_names for c, _ in stu_schema[t]['cols']))}
+    col_scores = smart_token_match_matrix(list(ans_col_idx), list(stu_col_idx))
+
+    def score_fn(ac: str, sc: str) -> float:
+        return col_scores[ans_col_idx[ac], stu_col_idx[sc]]
+
     # Tạo ma trận số cột match
     col_match_matrix = np.zeros((len(ans_cleaned_names), len(stu_cleaned_names)))
     for i, a_tbl_cleaned in enumerate(ans_cleaned_names):
         for j, s_tbl_cleaned in enumerate(stu_cleaned_names):
             col_match_matrix[i, j] = count_matching_columns(
                 ans_schema[a_tbl_cleaned]['cols'],
-                stu_schema[s_tbl_cleaned]['cols']
+                stu_schema[s_tbl_cleaned]['cols'],
+                score_fn=score_fn
             )
     
     # Tính điểm cosine similarity
@@ -1,4 +1,7 @@
-from rapidfuzz import fuzz
+from typing import List
+
+import numpy as np
+from rapidfuzz import fuzz, process
 from .normalizer import canonical
 from .constants import FUZZY_THRESHOLD
 
@@ -62,3 +65,46 @@ def smart_token_match(a: str, b: str) -> int:
     ratio = fuzz.ratio(a.replace(' ', ''), b.replace(' ', ''))
     
     return max(token_set, partial, ratio)
+
+def smart_token_match_matrix(a_list: List[str], b_list: List[str]) -> np.ndarray:
+    """Ma trận smart_token_match(a, b) cho mọi cặp (a, b).
+
+    Phần fuzzy được tính bằng rapidfuzz.process.cdist (một lần gọi C++ cho cả ma
+    trận thay vì vòng lặp Python), sau đó áp các luật khớp hoàn toàn/viết tắt.
+
+    Returns:
+        np.ndarray shape (len(a_list), len(b_list)), cùng giá trị với smart_token_match
+    """
+    ca = [canonical(a) for a in a_list]
+    cb = [canonical(b) for b in b_list]
+    if not ca or not cb:
+        return np.zeros((len(ca), len(cb)))
+
+    scores = process.cdist(ca, cb, scorer=fuzz.token_set_ratio, dtype=np.float64, workers=-1)
+    np.maximum(scores, process.cdist(ca, cb, scorer=fuzz.partial_ratio, dtype=np.float64, workers=-1),
+               out=scores)
+    np.maximum(scores, process.cdist([a.replace(' ', '') for a in ca], [b.replace(' ', '') for b in cb],
+                                     scorer=fuzz.ratio, dtype=np.float64, workers=-1),
+               out=scores)
+
+    # Các luật viết tắt/khớp hoàn toàn được ưu tiên hơn điểm fuzzy, áp theo thứ tự
+    # ưu tiên tăng dần để luật mạnh hơn ghi đè: 90 < 95 < 100
+    abbr_a = [_get_abbreviation(a) for a in ca]
+    abbr_b = [_get_abbreviation(b) for b in cb]
+    b_by_abbr, b_by_text, a_by_text = {}, {}, {}
+    for j, (b, ab) in enumerate(zip(cb, abbr_b)):
+        b_by_abbr.setdefault(ab, []).append(j)
+        b_by_text.setdefault(b, []).append(j)
+    for i, a in enumerate(ca):
+        a_by_text.setdefault(a, []).append(i)
+
+    for i, ab in enumerate(abbr_a):
+        if len(ab) >= 2:
+            scores[i, b_by_abbr.get(ab, [])] = 90
+            scores[i, b_by_text.get(ab, [])] = 95
+    for j, ab in enumerate(abbr_b):
+        if len(ab) >= 2:
+            scores[a_by_text.get(ab, []), j] = 95
+    for i, a in enumerate(ca):
+        scores[i, b_by_text.get(a, [])] = 100
+    return scores